@@ -30,6 +30,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
+import re
+import hashlib
+import inspect
 import xml.etree.ElementTree as ET
 import csv
 import math
@@ -42,6 +45,10 @@ import collections
 import numpy as np
 import pandas as pd
 import random
+import json
+import threading
+import queue
+import concurrent.futures
 # import sys
 # import os
 # import glob
@@ -62,6 +69,27 @@ IOP = 'IOP'  # Interoperability Tests
 LV = 'LV'
 HV = 'HV'
 
+# Measurement windows in cycles (per Table 3 of IEEE Std 1547-2018, see EutParameters)
+MRA_WINDOW_CYCLES = {'V': 10, 'P': 10, 'Q': 10, 'F': 60}
+MRA_WINDOW_CYCLES_TRANS = {'V': 5, 'F': 5}
+# Maximum number of capture rows added per measurement window when the DAQ driver has no data_read()
+WINDOW_CAPTURE_ROWS = 10
+
+# EUT response to phase imbalance (eut.imbalance_resp)
+IMB_INDIVIDUAL = 'EUT response to the individual phase voltages'
+IMB_AVERAGE = 'EUT response to the average of the three-phase effective (RMS)'
+IMB_POSITIVE = 'EUT response to the positive sequence of voltages'
+
+# Library log levels (vw.log_level)
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_ERROR = 40
+LOG_LEVELS = {'Debug': LOG_DEBUG, 'Info': LOG_INFO, 'Error': LOG_ERROR}
+
+# Measurement error distributions of the Monte Carlo margin analysis (vw.mc_distribution)
+MC_NORMAL = 'Normal'
+MC_UNIFORM = 'Uniform'
+
 FULL_NAME = {'V': 'Voltage',
              'P': 'Active Power',
              'Q': 'Reactive Power',
@@ -77,6 +105,47 @@ def VersionValidation(script_version):
 
 class pAus4777Error(Exception):
     pass
+
+
+class CurveAborted(pAus4777Error):
+    """
+    Raised by the fail-fast evaluation when a step has irrecoverably failed, the rest of the curve is skipped
+    """
+    def __init__(self, step_label, reason):
+        pAus4777Error.__init__(self, f'{step_label}: {reason}')
+        self.step_label = step_label
+        self.reason = reason
+
+
+def parse_power_levels(value):
+    """
+    Power levels of a sweep from a comma separated string (e.g. '1.0, 0.66, 0.33')
+    :return: list of the power levels in p.u. of the available power, [1.0] if value is empty
+    """
+    if value is None or str(value).strip() == '':
+        return [1.0]
+    try:
+        levels = [float(level) for level in str(value).split(',') if level.strip()]
+    except ValueError:
+        raise pAus4777Error(f'Invalid power levels: {value}')
+    labels = {}
+    for level in levels:
+        if not 0. < level <= 1.:
+            raise pAus4777Error(f'Power level {level} out of range (0, 1]')
+        # the curves of the sweep are labelled in percent (e.g. AA_67PCT)
+        label = power_level_label(level)
+        if label in labels:
+            raise pAus4777Error(f'Power levels {labels[label]} and {level} have the same label {label}')
+        labels[label] = level
+    return levels
+
+
+def power_level_label(pwr):
+    """
+    Label of a power level in the curve and dataset names, e.g. 67PCT for 0.67
+    """
+    return f'{round(pwr * 100)}PCT'
+
 """
 This section is for EUT parameters needed such as V, P, Q, etc.
 """
@@ -139,6 +208,9 @@ class EutParameters(object):
             else:
                 self.var_rated = None
             # self.imbalance_angle_fix = imbalance_angle_fix
+            self.imbalance_resp = ts.param_value('eut.imbalance_resp')
+            if self.imbalance_resp is None:
+                self.imbalance_resp = IMB_AVERAGE
             self.absorb = ts.param_value('eut.abs_enabled')
 
         except Exception as e:
@@ -150,7 +222,8 @@ This section is utility function needed to run the scripts such as data acquisit
 """
 
 class UtilParameters:
-    def __init__(self):
+    def __init__(self, log_level=None):
+        self.logger = LibraryLog(self.ts, level=LOG_LEVELS.get(log_level, LOG_DEBUG))
         self.step_label = None
         self.pwr = 1.0
         self.region = ''
@@ -158,15 +231,15 @@ class UtilParameters:
 
     def reset_curve(self, region='AA'):
         self.region = region
-        self.ts.log_debug(f'P4777 Library curve has been set {region}')
+        self.logger.debug('P4777 Library curve has been set %s', region)
 
     def reset_pwr(self, pwr=1.0):
         self.pwr = pwr
-        self.ts.log_debug(f'P4777 Library power level has been set {round(pwr*100)}%')
+        self.logger.debug('P4777 Library power level has been set %s%%', round(pwr*100))
 
     def reset_filename(self, filename):
         self.filename = filename
-        self.ts.log_debug(f'P4777 Library filename has been set to {filename}')
+        self.logger.debug('P4777 Library filename has been set to %s', filename)
 
     def set_step_label(self, starting_label=None):
         """
@@ -244,16 +317,14 @@ class UtilParameters:
             if self.phases == 'Single phase':
                 value = data.get(self.get_measurement_label(type_meas)[0])
                 if log:
-                    self.ts.log_debug('        %s are: %s'
-                                      % (self.get_measurement_label(type_meas), value))
+                    self.logger.debug('        %s are: %s', self.get_measurement_label(type_meas), value)
                 nb_phases = 1
 
             elif self.phases == 'Split phase':
                 value1 = data.get(self.get_measurement_label(type_meas)[0])
                 value2 = data.get(self.get_measurement_label(type_meas)[1])
                 if log:
-                    self.ts.log_debug('        %s are: %s, %s'
-                                      % (self.get_measurement_label(type_meas), value1, value2))
+                    self.logger.debug('        %s are: %s, %s', self.get_measurement_label(type_meas), value1, value2)
                 value = value1 + value2
                 nb_phases = 2
 
@@ -262,8 +333,8 @@ class UtilParameters:
                 value2 = data.get(self.get_measurement_label(type_meas)[1])
                 value3 = data.get(self.get_measurement_label(type_meas)[2])
                 if log:
-                    self.ts.log_debug('        %s are: %s, %s, %s'
-                                      % (self.get_measurement_label(type_meas), value1, value2, value3))
+                    self.logger.debug('        %s are: %s, %s, %s', self.get_measurement_label(type_meas), value1,
+                                      value2, value3)
                 value = value1 + value2 + value3
                 nb_phases = 3
 
@@ -272,43 +343,545 @@ class UtilParameters:
             self.ts.log_error('phases=%s' % self.phases)
             raise pAus4777Error('Error in get_measurement_total() : %s' % (str(e)))
 
-        # TODO : imbalance_resp should change the way you acquire the data
         if type_meas == 'V':
-            # average value of V
-            value = value / nb_phases
+            if nb_phases == 3 and self.imbalance_resp != IMB_AVERAGE:
+                value = self.get_imbalance_value(data=data, type_meas=type_meas)
+            else:
+                # average value of V
+                value = value / nb_phases
         elif type_meas == 'F':
             # No need to do data average for frequency
             value = data.get(self.get_measurement_label(type_meas)[0])
 
-        return round(value, 3)
+        if np.ndim(value) == 0:
+            return round(float(value), 3)
+        # dataset
+        return np.round(np.asarray(value, dtype=float), 3)
 
     def get_script_name(self):
         if self.script_complete_name is None:
             self.script_complete_name = 'Script name not initialized'
         return self.script_complete_name
 
+class WindowAverage(object):
+    """
+    Average of the samples of one measurement window, accumulated sample by sample. Only the running sum
+    and count are kept: the window does not roll, it is restarted with reset() at its start instant and the
+    samples pushed until its end are averaged.
+    """
+    def __init__(self, duration):
+        self.duration = duration
+        self.total = 0.
+        self.count = 0
+
+    def reset(self):
+        self.total = 0.
+        self.count = 0
+
+    def push(self, value):
+        self.total += value
+        self.count += 1
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+class MeasurementWindows(object):
+    """
+    Measurement windows per DAQ channel sized in cycles of f_nom as specified by the minimum
+    required accuracy table (see EutParameters)
+    """
+    def __init__(self, f_nom, channels, transient=False):
+        """
+        :param f_nom:       nominal frequency (Hz)
+        :param channels:    dictionary {type_meas: [channel labels]} e.g. {'V': ['AC_VRMS_1']}
+        :param transient:   True to use the transient measurement windows
+        """
+        if transient:
+            cycles = MRA_WINDOW_CYCLES_TRANS
+        else:
+            cycles = MRA_WINDOW_CYCLES
+        self.windows = {}
+        for type_meas, labels in channels.items():
+            duration = cycles.get(type_meas, cycles['V']) / f_nom
+            for label in labels:
+                self.windows[label] = WindowAverage(duration)
+        self.duration = max([w.duration for w in self.windows.values()] + [0.])
+
+    def reset(self):
+        for window in self.windows.values():
+            window.reset()
+
+    def push(self, data):
+        for label, window in self.windows.items():
+            value = data.get(label)
+            if value is not None:
+                window.push(value)
+
+    def average(self, timestamps, values, channels, end_time, data):
+        """
+        Window averages computed from a block of records instead of the pushed samples
+        :param timestamps:  record timestamps (s)
+        :param values:      record values, one column per channel
+        :param channels:    channel labels of the columns
+        :param end_time:    end of the windows (timestamp in s)
+        :param data:        sample completed with the averages (e.g. the last record)
+        """
+        averaged = dict(data)
+        columns = {label: i for i, label in enumerate(channels)}
+        for label, window in self.windows.items():
+            if label not in columns or len(timestamps) == 0:
+                continue
+            lo = np.searchsorted(timestamps, end_time - window.duration, side='right')
+            # the latest record is always used even if the capture is slower than the window
+            lo = min(lo, len(timestamps) - 1)
+            window_values = values[lo:, columns[label]]
+            if not np.isnan(window_values).all():
+                averaged[label] = float(np.nanmean(window_values))
+        return averaged
+
+    def dataset_average(self, timestamps, columns, ends):
+        """
+        Window averages of dataset columns for the windows ending at each instant of ends, the channels
+        without measurement window take their value at the instant
+        :param timestamps:  dataset time (s), increasing
+        :param columns:     dictionary {label: values} of the dataset columns
+        :param ends:        array of the window end instants (s)
+        :return:            dictionary {label: array shaped as ends}
+        """
+        ends = np.asarray(ends, dtype=float)
+        averaged = {}
+        for label, values in columns.items():
+            values = np.asarray(values, dtype=float)
+            at_end = np.interp(ends, timestamps, values)
+            window = self.windows.get(label)
+            if window is None:
+                averaged[label] = at_end
+                continue
+            valid = ~np.isnan(values)
+            sums = np.concatenate(([0.], np.cumsum(np.where(valid, values, 0.))))
+            counts = np.concatenate(([0], np.cumsum(valid)))
+            lo = np.searchsorted(timestamps, ends - window.duration, side='right')
+            hi = np.searchsorted(timestamps, ends, side='right')
+            n = counts[hi] - counts[lo]
+            # a window without any dataset row takes the value at its end
+            averaged[label] = np.where(n > 0, (sums[hi] - sums[lo]) / np.maximum(n, 1), at_end)
+        return averaged
+
+    def get_data(self, data):
+        """
+        Returns a copy of the DAQ sample with the windowed channels replaced by their window average
+        """
+        averaged = dict(data)
+        for label, window in self.windows.items():
+            value = window.mean()
+            if value is not None:
+                averaged[label] = value
+        return averaged
+
+
+def dataset_frame(ds):
+    """
+    Returns a DAQ dataset (svpelab Dataset with points and data) as a pandas DataFrame
+    """
+    if isinstance(ds, pd.DataFrame):
+        return ds
+    return pd.DataFrame({point: ds.data[i] for i, point in enumerate(ds.points)})
+
+
+class ScFrame(object):
+    """
+    Soft channel row of the DAQ with a precomputed slot for each sc point. The values are set in place and
+    committed to daq.sc in a single update so all the channels of a sample belong to the same row.
+    """
+    def __init__(self, sc_points):
+        self.slots = {name: index for index, name in enumerate(sc_points)}
+        self.names = list(sc_points)
+        self.values = [None] * len(self.names)
+
+    def __setitem__(self, name, value):
+        try:
+            self.values[self.slots[name]] = value
+        except KeyError:
+            raise pAus4777Error('Soft channel %s is not an sc point' % name)
+
+    def __getitem__(self, name):
+        try:
+            return self.values[self.slots[name]]
+        except KeyError:
+            raise pAus4777Error('Soft channel %s is not an sc point' % name)
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def set(self, values):
+        for name, value in values.items():
+            self[name] = value
+
+    def as_dict(self):
+        return dict(zip(self.names, self.values))
+
+    def commit(self, daq):
+        """
+        Writes the soft channels of the frame to the DAQ, the slots never set (None) keep the DAQ value
+        """
+        daq.sc.update((name, value) for name, value in zip(self.names, self.values) if value is not None)
+
+
+class LibraryLog(object):
+    """
+    Logging facade of the library. The level is checked before anything is formatted and the messages are
+    formatted with their arguments on the calling thread. They are then sent to the test script by a
+    background thread so the sampling loops never wait on the log I/O; flush() or close() waits until all
+    of them are sent. The keyword fields of a message (step, tr, channel, value, ...) are also written as a
+    JSON line in the records file when one is opened.
+    """
+    def __init__(self, ts, level=LOG_DEBUG, buffered=True):
+        self.ts = ts
+        self.level = level
+        self.buffered = buffered
+        self.records = None
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def open_records(self, filename):
+        self.flush()
+        if self.records is not None:
+            self.records.close()
+        self.records = open(filename, 'a')
+
+    def debug(self, msg, *args, **fields):
+        if LOG_DEBUG >= self.level:
+            self._put(LOG_DEBUG, msg, args, fields)
+
+    def info(self, msg, *args, **fields):
+        if LOG_INFO >= self.level:
+            self._put(LOG_INFO, msg, args, fields)
+
+    def error(self, msg, *args, **fields):
+        if LOG_ERROR >= self.level:
+            self._put(LOG_ERROR, msg, args, fields)
+
+    def _put(self, level, msg, args, fields):
+        # formatted now, the arguments may be changed by the caller once the message is queued
+        if args:
+            message = msg % args
+        else:
+            message = str(msg)
+        line = None
+        if self.records is not None and fields:
+            entry = {'time': time.time(), 'level': level, 'message': message}
+            entry.update(fields)
+            line = json.dumps(entry, default=str) + '\n'
+        record = (level, message, line)
+        if not self.buffered:
+            self._emit(record)
+            return
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='p4777-log', daemon=True)
+                    self.thread.start()
+        self.queue.put(record)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self._emit(record)
+            except Exception:
+                pass
+            finally:
+                self.queue.task_done()
+
+    def _emit(self, record):
+        level, message, line = record
+        if level >= LOG_ERROR:
+            self.ts.log_error(message)
+        elif level >= LOG_INFO:
+            self.ts.log(message)
+        else:
+            self.ts.log_debug(message)
+        if line is not None and self.records is not None:
+            self.records.write(line)
+
+    def flush(self):
+        """
+        Waits until all the queued messages have been sent
+        """
+        if self.thread is not None:
+            self.queue.join()
+        if self.records is not None:
+            self.records.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.records is not None:
+            self.records.close()
+            self.records = None
+
+
+class EnvelopeTable(object):
+    """
+    Pass/fail envelope of a characteristic curve (target, min and max vs voltage) sampled once on a fine
+    voltage grid. The bounds of any voltage (scalar or dataset array) are found by index arithmetic and a
+    linear interpolation between the two nearest points of the grid. Outside the grid the curve is flat.
+    """
+    def __init__(self, x, y, pwr=1.0, v_tol=0., y_tol=0., resolution=0.001):
+        """
+        :param x:           curve voltages (V)
+        :param y:           curve values at the voltages (P or Q)
+        :param pwr:         power level in p.u. applied to the curve values
+        :param v_tol:       voltage tolerance (1.5 x MRA V)
+        :param y_tol:       tolerance on the curve values (1.5 x MRA P or Q)
+        :param resolution:  voltage step of the table (V)
+        """
+        self.x = list(x)
+        self.y = list(y)
+        self.pwr = pwr
+        self.v_tol = v_tol
+        self.resolution = resolution
+        self.v_start = min(x) - 2. * v_tol - resolution
+        n = int(np.ceil((max(x) + 2. * v_tol + resolution - self.v_start) / resolution)) + 1
+        v = self.v_start + np.arange(n) * resolution
+        self.target = np.interp(v, x, y) * pwr
+        self.min = np.interp(v + v_tol, x, y) * pwr
+        self.max = np.interp(v - v_tol, x, y) * pwr
+        self.y_tol = y_tol
+
+    def _lookup(self, table, v):
+        position = (np.asarray(v, dtype=float) - self.v_start) / self.resolution
+        position = np.clip(position, 0., len(table) - 1.)
+        index = np.minimum(position.astype(int), len(table) - 2)
+        weight = position - index
+        return table[index] * (1. - weight) + table[index + 1] * weight
+
+    def get_target(self, v):
+        target = np.round(self._lookup(self.target, v), 1)
+        if np.ndim(target) == 0:
+            return float(target)
+        return target
+
+    def get_bounds(self, v):
+        """
+        :param v:   measured voltage(s)
+        :return:    (min, max) of the pass/fail envelope
+        """
+        target_min = np.round(self._lookup(self.min, v), 1) - self.y_tol
+        target_max = np.round(self._lookup(self.max, v), 1) + self.y_tol
+        if np.ndim(target_min) == 0:
+            return float(target_min), float(target_max)
+        return target_min, target_max
+
+
+class FunctionEvaluator(object):
+    """
+    Envelope tables of all the active functions sampled on one common voltage grid and stacked in a single
+    array. The targets and pass/fail bounds of every function are evaluated for a batch of samples in one
+    pass: the grid index and weight of the samples are computed once, and each sample gathers one row of the
+    table holding the values and the slopes of all the functions at its grid point.
+    """
+    def __init__(self, envelopes, resolution=0.001):
+        """
+        :param envelopes:   OrderedDict {y: EnvelopeTable} (e.g. {'P': VW envelope, 'Q': VV envelope})
+        :param resolution:  voltage step of the common grid (V)
+        """
+        self.names = list(envelopes.keys())
+        self.resolution = resolution
+        self.v_start = min(envelope.v_start for envelope in envelopes.values())
+        v_end = max(envelope.v_start + (len(envelope.target) - 1) * envelope.resolution
+                    for envelope in envelopes.values())
+        n = int(np.ceil((v_end - self.v_start) / resolution)) + 1
+        v = self.v_start + np.arange(n) * resolution
+        tables = []
+        for envelope in envelopes.values():
+            tables.append(np.interp(v, envelope.x, envelope.y) * envelope.pwr)
+            tables.append(np.interp(v + envelope.v_tol, envelope.x, envelope.y) * envelope.pwr)
+            tables.append(np.interp(v - envelope.v_tol, envelope.x, envelope.y) * envelope.pwr)
+        # columns: target, min and max of each function, then their slopes to the next grid point
+        values = np.column_stack(tables)
+        slopes = np.zeros_like(values)
+        slopes[:-1] = np.diff(values, axis=0)
+        self.table = np.hstack([values, slopes])
+        self.y_tol = np.array([envelope.y_tol for envelope in envelopes.values()])
+
+    def evaluate(self, v):
+        """
+        :param v:   measured voltage(s), scalar or array
+        :return:    OrderedDict {y: (target, min, max)}
+        """
+        v = np.asarray(v, dtype=float)
+        n, width = self.table.shape[0], self.table.shape[1] // 2
+        position = np.clip((v.ravel() - self.v_start) / self.resolution, 0., n - 1.)
+        index = np.minimum(position.astype(int), n - 2)
+        rows = np.take(self.table, index, axis=0)
+        values = rows[:, :width]
+        values += rows[:, width:] * (position - index)[:, None]
+        values = np.round(values, 1).T.reshape((len(self.names), 3) + v.shape)
+        result = OrderedDict()
+        for i, name in enumerate(self.names):
+            target, target_min, target_max = values[i, 0], values[i, 1] - self.y_tol[i], values[i, 2] + self.y_tol[i]
+            if v.ndim == 0:
+                result[name] = (float(target), float(target_min), float(target_max))
+            else:
+                result[name] = (target, target_min, target_max)
+        return result
+
+
 class DataLogging:
     def __init__(self):
         self.type_meas = {'V': 'AC_VRMS', 'I': 'AC_IRMS', 'P': 'AC_P', 'Q': 'AC_Q', 'VA': 'AC_S',
-                          'F': 'AC_FREQ', 'PF': 'AC_PF'}
+                          'F': 'AC_FREQ', 'PF': 'AC_PF', 'V_ANGLE': 'AC_VPH', 'I_ANGLE': 'AC_IPH'}
 
         self.rslt_sum_col_name = ''
         self.sc_points = {}
         #self._config()
         self.set_sc_points()
+        self.sc_frame = ScFrame(self.sc_points['sc'])
         self.set_result_summary_name()
         self.tr = None
         self.n_tr = None
         self.initial_value = {}
         self.tr_value = collections.OrderedDict()
         self.current_step_label = None
+        self.envelopes = {}
+        self.sample_source = None
+        self.deferred_steps = []
+        self.mra_windows = MeasurementWindows(
+            f_nom=self.f_nom if self.f_nom else 50.,
+            channels={meas_value: self.get_measurement_label(meas_value) for meas_value in self.meas_values})
     #def __config__(self):
 
     def reset_time_settings(self, tr, number_tr=2):
         self.tr = tr
-        self.ts.log_debug(f'P4777 Time response has been set to {self.tr} seconds')
+        self.logger.debug('P4777 Time response has been set to %s seconds', self.tr)
         self.n_tr = number_tr
-        self.ts.log_debug(f'P4777 Number of Time response has been set to {self.n_tr} cycles')
+        self.logger.debug('P4777 Number of Time response has been set to %s cycles', self.n_tr)
+
+    def sample_window(self, daq, end_time):
+        """
+        Samples the DAQ continuously over the measurement windows ending at end_time. The DAQ is read with
+        data_read() which does not add rows to the capture dataset; a driver without it is sampled with
+        data_sample() at most WINDOW_CAPTURE_ROWS times per window so the dataset growth stays bounded.
+        The windows start at end_time minus the longest window and average every sample until end_time.
+        :param daq:         data acquisition object from svpelab library
+        :param end_time:    datetime at which the measurement window ends
+        :return: the last DAQ sample with the measured channels replaced by their window average
+        """
+        if self.sample_source is not None:
+            return self.read_window(end_time)
+        self.mra_windows.reset()
+        start_time = end_time - timedelta(seconds=self.mra_windows.duration)
+        if datetime.now() < start_time:
+            self.ts.sleep((start_time - datetime.now()).total_seconds())
+        sample_period = 1. / (self.f_nom if self.f_nom else 50.)
+        data_read = getattr(daq, 'data_read', None)
+        if data_read is None:
+            sample_period = max(sample_period, self.mra_windows.duration / WINDOW_CAPTURE_ROWS)
+        while True:
+            if data_read is not None:
+                data = self.read_sample(daq, data_read())
+            else:
+                daq.data_sample()
+                data = daq.data_capture_read()
+            now = datetime.now()
+            self.mra_windows.push(data)
+            if now >= end_time:
+                break
+            self.ts.sleep(min(sample_period, (end_time - now).total_seconds()))
+        return self.mra_windows.get_data(data)
+
+    @staticmethod
+    def read_sample(daq, reading):
+        """
+        Sample of a data_read() reading: the reading (a dictionary, or values in the order of daq.data_points)
+        completed with the channels it does not hold (TIME, soft channels) from the last captured record
+        """
+        data = dict(daq.data_capture_read() or {})
+        if isinstance(reading, dict):
+            data.update(reading)
+        elif reading is not None:
+            data.update(zip(daq.data_points, reading))
+        return data
+
+    def create_voltage_program(self, v_steps_dict):
+        """
+        Function to convert the voltage steps in a timed voltage program executed by the grid simulator
+        The C and H steps are held long enough to measure the initial values of the following step and
+        the other steps are held for the last time response (step time period).
+        :param v_steps_dict: Voltage step dictionnary from create_vw_dict_steps
+        :return: VoltageProgram
+        """
+        pre_step_time = max(1.0, 2 * self.mra_windows.duration)
+        step_time = self.tr[self.n_tr - 1] + pre_step_time
+        program = VoltageProgram()
+        for step_label, v_step in v_steps_dict.items():
+            if 'C' in step_label or 'H' in step_label:
+                program.add_step(step_label, v_step, pre_step_time)
+            else:
+                program.add_step(step_label, v_step, step_time)
+        self.ts.log_debug(f'Voltage program: {program.points}')
+        return program
+
+    def update_measure_value(self, data, daq):
+        # committed to the DAQ with the rest of the soft channel frame
+        for meas_value in self.meas_values:
+            self.sc_frame['%s_MEAS' % meas_value] = self.get_measurement_total(data=data, type_meas=meas_value,
+                                                                                log=False)
+
+    def get_capture_channels(self):
+        """
+        Returns the labels of all the channels read by get_measurement_total (phase values and angles)
+        """
+        channels = []
+        for type_meas in self.type_meas:
+            channels += self.get_measurement_label(type_meas)
+        return channels
+
+    def set_sample_source(self, source):
+        """
+        Reads the measurement windows from a capture source (e.g. AcquisitionThread) instead of sampling the DAQ
+        :param source:  object with read(start_time, end_time), latest(), value_at(timestamp) and channels
+                        (AcquisitionThread), None to sample the DAQ on demand
+        """
+        self.sample_source = source
+
+    def read_window(self, end_time):
+        """
+        Waits for the end of the measurement windows and averages the records of the sample source
+        :return: the last record with the measured channels replaced by their window average
+        """
+        if datetime.now() < end_time:
+            self.ts.sleep((end_time - datetime.now()).total_seconds())
+        end = end_time.timestamp()
+        # the record of end_time may still be in flight
+        deadline = time.time() + 1.
+        latest = self.sample_source.latest()
+        while (latest is None or self.sample_source.read(end, None)[0].size == 0) and time.time() < deadline:
+            time.sleep(0.001)
+            latest = self.sample_source.latest()
+        if latest is None:
+            raise pAus4777Error('No sample from the capture source')
+        # the channels without measurement window take their value at the exact end of the window
+        value = self.sample_source.value_at(end)
+        if value is not None:
+            latest.update(value)
+        timestamps, values = self.sample_source.read(end - self.mra_windows.duration, end)
+        data = self.mra_windows.average(timestamps, values, self.sample_source.channels, end, latest)
+        # the channels the DAQ does not measure (NaN in the records) are missing as in a DAQ sample
+        return {label: value for label, value in data.items()
+                if not (isinstance(value, float) and np.isnan(value))}
 
     def set_sc_points(self):
         """
@@ -335,7 +908,7 @@ class DataLogging:
                 row_data.append('%s_TARGET_MAX' % meas_value)
 
         row_data.append('EVENT')
-        self.ts.log_debug('Sc points: %s' % row_data)
+        self.logger.debug('Sc points: %s', row_data)
         self.sc_points['sc'] = row_data
 
     def set_result_summary_name(self):
@@ -353,6 +926,10 @@ class DataLogging:
         for y in ys:
             row_data.append(f'{y}_BEFORE_RCT_1S')
             row_data.append(f'{y}_BEFORE_RCT_10s')
+        if getattr(self, 'monte_carlo', None) is not None:
+            for y in ys:
+                row_data.append(f'{y}_FLIP_RCT_1S')
+                row_data.append(f'{y}_FLIP_RCT_10s')
 
         for meas_value in self.meas_values:
             row_data.append('%s_MEAS' % meas_value)
@@ -391,17 +968,17 @@ class DataLogging:
         # y2_points = '%s_TARGET,%s_MEAS' % (y2, y2)
 
         for y in y_variables:
-            self.ts.log_debug('y_temp: %s' % y)
+            self.logger.debug('y_temp: %s', y)
             # y_temp = self.get_measurement_label('%s' % y)
             y_temp = '{}'.format(','.join(str(x) for x in self.get_measurement_label('%s' % y)))
             y_title.append(FULL_NAME[y])
             y_points.append(y_temp)
-        self.ts.log_debug('y_points: %s' % y_points)
+        self.logger.debug('y_points: %s', y_points)
         y_points = ','.join(y_points)
         y_title = ','.join(y_title)
 
         for x in x_variables:
-            self.ts.log_debug('x_variable for result: %s' % x)
+            self.logger.debug('x_variable for result: %s', x)
             x_temp = '{}'.format(','.join(str(x) for x in self.get_measurement_label('%s' % x)))
             x_title.append(FULL_NAME[x])
             x_points.append(x_temp)
@@ -456,6 +1033,10 @@ class DataLogging:
         for y in ys:
             row_data.append(str(self.tr_value[f'{y}_T_COM_{1}_PF']))
             row_data.append(str(self.tr_value[f'{y}_T_COM_{2}_PF']))
+        if self.monte_carlo is not None:
+            for y in ys:
+                row_data.append(str(self.tr_value[f'{y}_T_COM_{1}_FLIP']))
+                row_data.append(str(self.tr_value[f'{y}_T_COM_{2}_FLIP']))
 
 
         # Default measured values are V, P and Q (F can be added) refer to set_meas_variable function
@@ -480,46 +1061,75 @@ class DataLogging:
         # except Exception as e:
         #     raise p1547Error('Error in write_rslt_sum() : %s' % (str(e)))
 
-    def start(self, daq, step_label):
+    def start(self, daq, step_label, timestamp=None):
         """
         Sum the EUT reactive power from all phases
         :param daq:         data acquisition object from svpelab library
         :param step:        test procedure step letter or number (e.g "Step G")
+        :param timestamp:   datetime of the step when it is executed by a voltage program, None if the step
+                            is applied right after this call
         :return: returns a dictionary with the timestamp, event and total EUT reactive power
         """
-        # TODO : In a more sophisticated approach, get_initial['timestamp'] will come from a
-        #  reliable secure thread or data acquisition timestamp
+        # The timestamps are taken from the script clock, resolve_steps() replaces the values of the deferred
+        # steps by the values at the DAQ timestamps of the captured dataset
 
-        self.initial_value['timestamp'] = datetime.now()
         self.current_step_label = step_label
-        daq.sc['EVENT'] = self.current_step_label + '_INIT'
-        daq.data_sample()
-        data = daq.data_capture_read()
-        daq.sc['EVENT'] = self.current_step_label
+        frame = self.sc_frame
+        frame['EVENT'] = self.current_step_label + '_INIT'
+        frame.commit(daq)
+        if timestamp is None:
+            data = self.sample_window(daq=daq, end_time=datetime.now() + timedelta(seconds=self.mra_windows.duration))
+            self.set_initial_values(data)
+            # the step starts when the step command returns (step_applied)
+            self.initial_value['timestamp'] = None
+            frame.commit(daq)
+            return
+        data = self.sample_window(daq=daq, end_time=timestamp)
+        self.set_initial_values(data)
+        self.step_applied(daq, timestamp=timestamp)
+
+        #return self.initial_value
+
+    def step_applied(self, daq, timestamp=None):
+        """
+        Marks the step time, called right after the step command (e.g. grid.voltage()) so the command latency
+        is not counted in the time responses. The rows of the step event start here.
+        :param daq:         data acquisition object from svpelab library
+        :param timestamp:   datetime of the step, default now
+        """
+        self.initial_value['timestamp'] = timestamp if timestamp is not None else datetime.now()
+        self.sc_frame['EVENT'] = self.current_step_label
+        self.sc_frame.commit(daq)
+        if self.sample_source is None:
+            daq.data_sample()
+
+    def set_initial_values(self, data):
+        """
+        Stores the initial X and Y values of the step measured in data and writes them in the soft channel frame
+        """
+        frame = self.sc_frame
         if isinstance(self.x_criteria, list):
             for xs in self.x_criteria:
                 self.initial_value[xs] = {'x_value': self.get_measurement_total(data=data, type_meas=xs, log=False)}
-                daq.sc['%s_MEAS' % xs] = self.initial_value[xs]['x_value']
+                frame['%s_MEAS' % xs] = self.initial_value[xs]['x_value']
         else:
             self.initial_value[self.x_criteria] = {'x_value': self.get_measurement_total(data=data, type_meas=self.x_criteria, log=False)}
-            daq.sc['%s_MEAS' % self.x_criteria] = self.initial_value[self.x_criteria]['x_value']
+            frame['%s_MEAS' % self.x_criteria] = self.initial_value[self.x_criteria]['x_value']
 
         if isinstance(self.y_criteria, list):
             for ys in self.y_criteria:
                 self.initial_value[ys] = {'y_value': self.get_measurement_total(data=data, type_meas=ys, log=False)}
-                daq.sc['%s_MEAS' % ys] = self.initial_value[ys]["y_value"]
+                frame['%s_MEAS' % ys] = self.initial_value[ys]["y_value"]
         elif isinstance(self.y_criteria, dict):
             for ys in list(self.y_criteria.keys()):
                 self.initial_value[ys] = {'y_value': self.get_measurement_total(data=data, type_meas=ys, log=False)}
-                daq.sc['%s_MEAS' % ys] = self.initial_value[ys]["y_value"]
+                frame['%s_MEAS' % ys] = self.initial_value[ys]["y_value"]
         else:
             self.initial_value[self.y_criteria] = {'y_value': self.get_measurement_total(data=data, type_meas=self.y_criteria, log=False)}
-            daq.sc['%s_MEAS' % self.y_criteria] = self.initial_value[self.y_criteria]['y_value']
-        daq.data_sample()
+            frame['%s_MEAS' % self.y_criteria] = self.initial_value[self.y_criteria]['y_value']
 
-        #return self.initial_value
-
-    def record_timeresponse(self, daq, step_value, pwr_lvl=1.0, curve=1, x_target=None, y_target=None):
+    def record_timeresponse(self, daq, step_value, pwr_lvl=1.0, curve=1, x_target=None, y_target=None,
+                            evaluate=False):
         """
         Get the data from a specific time response (tr) corresponding to x and y values returns a dictionary
         but also writes in the soft channels of the DAQ system
@@ -530,6 +1140,8 @@ class DataLogging:
         :param x_target:        The target value of X value (e.g. FW -> f_step)
         :param y_target:        The target value of Y value (e.g. LAP -> act_pwrs_limits)
         :param n_tr:            The number of time responses used to validate the response and steady state values
+        :param evaluate:        True to evaluate the criteria of the step once all the Tr are recorded, they are
+                                not evaluated again if the fail-fast evaluation already did it
 
         :return: returns a dictionary with the timestamp, event and total EUT reactive power
         """
@@ -538,6 +1150,8 @@ class DataLogging:
         y = list(self.y_criteria.keys())
         T_Com_names = {1: '1S', 2: '10S', 3: '20S'}
         tr_list = []
+        if self.initial_value.get('timestamp') is None:
+            self.step_applied(daq)
 
         for i in range(self.n_tr):
             tr_list.append(self.initial_value['timestamp'] + timedelta(seconds=self.tr[i]))
@@ -550,104 +1164,298 @@ class DataLogging:
                     self.tr_value['%s_T_COM_%s_MIN' % (meas_value, i)] = None
                     self.tr_value['%s_T_COM_%s_MAX' % (meas_value, i)] = None
         tr_iter = 1
+        frame = self.sc_frame
+        self.criterias_evaluated = False
 
         for tr_ in tr_list:
             now = datetime.now()
             if now <= tr_:
                 time_to_sleep = tr_ - datetime.now()
-                self.ts.log('Waiting %s seconds to get the next Tr data for analysis...' %
-                            time_to_sleep.total_seconds())
-                self.ts.sleep(time_to_sleep.total_seconds())
-            daq.sc['EVENT'] = "{0}_T_COM_{1}".format(self.current_step_label, T_Com_names[tr_iter])
-            daq.data_sample()  # sample new data
-            data = daq.data_capture_read()  # Return dataset created from last data capture
-
-            # update the meas values in the dataset
-            self.update_measure_value(data, daq)
-
-            daq.sc['EVENT'] = "{0}_T_COM".format(self.current_step_label)
-            # update daq.sc values for Y_TARGET, Y_TARGET_MIN, and Y_TARGET_MAX
-
-            # store the daq.sc['Y_TARGET'], daq.sc['Y_TARGET_MIN'], and daq.sc['Y_TARGET_MAX'] in tr_value
-
-            for meas_value in self.meas_values:
-                try:
-                    self.tr_value['%s_T_COM_%s' % (meas_value, tr_iter)] = daq.sc['%s_MEAS' % meas_value]
-
-                    self.ts.log('Value %s: %s' % (meas_value, daq.sc['%s_MEAS' % meas_value]))
-                    if meas_value in x:
-                        daq.sc['%s_TARGET' % meas_value] = step_value
-                        self.tr_value['%s_T_COM_TARG_%s' % (meas_value, tr_iter)] = step_value
-                        self.ts.log('X Value (%s) = %s' % (meas_value, daq.sc['%s_MEAS' % meas_value]))
-                    elif meas_value in y:
-                        self.ts.log_debug(f'{meas_value} and {y}')
-                        daq.sc['%s_TARGET' % meas_value] = self.update_target_value(value=step_value,
-                                                                                    function=self.y_criteria[meas_value])
-                        daq.sc['%s_TARGET_MIN' % meas_value], daq.sc['%s_TARGET_MAX' % meas_value] =\
-                            self.calculate_min_max_values(data=data, function=self.y_criteria[meas_value])
-
-                        self.tr_value[f'{meas_value}_T_COM_TARG_{tr_iter}'] = daq.sc['%s_TARGET' % meas_value]
-                        self.tr_value[f'{meas_value}_T_COM_{tr_iter}_MIN'] = daq.sc['%s_TARGET_MIN' % meas_value]
-                        self.tr_value[f'{meas_value}_T_COM_{tr_iter}_MAX'] = daq.sc['%s_TARGET_MAX' % meas_value]
-                        self.ts.log('Y Value (%s) = %s. Pass/fail bounds = [%s, %s]' %
-                                     (meas_value, daq.sc['%s_MEAS' % meas_value],
-                                      daq.sc['%s_TARGET_MIN' % meas_value], daq.sc['%s_TARGET_MAX' % meas_value]))
-                except Exception as e:
-                    self.ts.log_debug('Measured value (%s) not recorded: %s' % (meas_value, e))
-                    raise
+                self.logger.info('Waiting %s seconds to get the next Tr data for analysis...',
+                                 time_to_sleep.total_seconds())
+            frame['EVENT'] = "{0}_T_COM_{1}".format(self.current_step_label, T_Com_names[tr_iter])
+            frame.commit(daq)
+            # sample new data over the measurement window ending at Tr
+            data = self.sample_window(daq=daq, end_time=tr_)
+
+            frame['EVENT'] = "{0}_T_COM".format(self.current_step_label)
+            self.set_tr_values(data, step_value, tr_iter)
+            frame.commit(daq)
             #self.tr_value[tr_iter]["timestamp"] = tr_
             self.tr_value[f'timestamp_{tr_iter}'] = tr_
+            try:
+                self.stream_criterias(tr_iter)
+            except CurveAborted:
+                frame['EVENT'] = "{0}_ABORTED".format(self.current_step_label)
+                frame.commit(daq)
+                if self.sample_source is None:
+                    daq.data_sample()
+                raise
             tr_iter = tr_iter + 1
 
-
+        if evaluate and not self.criterias_evaluated:
+            self.evaluate_criterias()
         return self.tr_value
 
         # except Exception as e:
         #    raise p1547Error('Error in get_tr_data(): %s' % (str(e)))
 
-    def update_target_value(self, value, function):
+    def set_tr_values(self, data, step_value, tr_iter):
+        """
+        Stores the measured, target, min and max values of Tr tr_iter in tr_value and in the soft channel frame
+        :param data:            measurements at Tr (window averages or dataset values)
+        :param step_value:      the target value of X (e.g. voltage step)
+        :param tr_iter:         Tr number (1 to n_tr)
+        """
+        x = self.x_criteria
+        y = list(self.y_criteria.keys())
+        frame = self.sc_frame
+        # update the meas values in the soft channel frame
+        self.update_measure_value(data, None)
+        bounds = self.evaluate_functions(data)
 
-        if function == VV:
-            vv_pairs=self.get_params(function=VV, region=self.region)
-            x = [vv_pairs['Vv1'], vv_pairs['Vv2'],
-                 vv_pairs['Vv3'], vv_pairs['Vv4']]
-            y = [vv_pairs['Q1'], vv_pairs['Q2'],
-                 vv_pairs['Q3'], vv_pairs['Q4']]
-            q_value = float(np.interp(value, x, y))
-            q_value *= self.pwr
-            return round(q_value, 1)
+        # update the frame values for Y_TARGET, Y_TARGET_MIN, and Y_TARGET_MAX and store them in tr_value
+        for meas_value in self.meas_values:
+            try:
+                meas = frame['%s_MEAS' % meas_value]
+                self.tr_value['%s_T_COM_%s' % (meas_value, tr_iter)] = meas
+                self.logger.info('Value %s: %s', meas_value, meas, step=self.current_step_label, tr=tr_iter,
+                                 channel=meas_value, value=meas)
+                if meas_value in x:
+                    frame['%s_TARGET' % meas_value] = step_value
+                    self.tr_value['%s_T_COM_TARG_%s' % (meas_value, tr_iter)] = step_value
+                    self.logger.info('X Value (%s) = %s', meas_value, meas)
+                elif meas_value in y:
+                    target = self.update_target_value(value=step_value, function=self.y_criteria[meas_value])
+                    target_min, target_max = bounds[meas_value][1:]
+                    frame['%s_TARGET' % meas_value] = target
+                    frame['%s_TARGET_MIN' % meas_value] = target_min
+                    frame['%s_TARGET_MAX' % meas_value] = target_max
+
+                    self.tr_value[f'{meas_value}_T_COM_TARG_{tr_iter}'] = target
+                    self.tr_value[f'{meas_value}_T_COM_{tr_iter}_MIN'] = target_min
+                    self.tr_value[f'{meas_value}_T_COM_{tr_iter}_MAX'] = target_max
+                    self.logger.info('Y Value (%s) = %s. Pass/fail bounds = [%s, %s]', meas_value, meas,
+                                     target_min, target_max, step=self.current_step_label, tr=tr_iter,
+                                     channel=meas_value, target=target, min=target_min, max=target_max)
+            except Exception as e:
+                self.logger.debug('Measured value (%s) not recorded: %s', meas_value, e)
+                raise
+
+    def defer_step(self, step_value, row):
+        """
+        Keeps a measured step to be resolved against the captured dataset (resolve_steps)
+        :param step_value:  the target value of X (e.g. voltage step)
+        :param row:         result summary row of the live measurements, used if the step is not in the dataset
+        """
+        self.deferred_steps.append((self.current_step_label, step_value, row))
 
-        if function == VW:
-            vw_pairs = self.get_params(function=VW, region=self.region)
-            x = [vw_pairs['Vw1'], vw_pairs['Vw2']]
-            y = [vw_pairs['P1'], vw_pairs['P2']]
-            p_value = float(np.interp(value, x, y))
-            p_value *= self.pwr
-            return round(p_value, 1)
+    def resolve_steps(self, ds):
+        """
+        Recomputes the deferred steps with the values of the captured dataset at the DAQ timestamps. The step
+        time is the first row of the step event where the voltage has covered half of the step (the first row
+        of the step event if the voltage does not move). The initial values are averaged over the measurement
+        windows ending at the step time and the Tr values over the windows ending at each Tr after it.
+        :param ds:      dataset from daq.data_capture_dataset() (or DataFrame) with the TIME and EVENT columns
+        :return:        list of (step label, result summary row)
+        """
+        steps, self.deferred_steps = self.deferred_steps, []
+        if not steps:
+            return []
+        df = dataset_frame(ds)
+        if 'TIME' not in df.columns or 'EVENT' not in df.columns:
+            self.logger.error('Dataset without TIME and EVENT, live step values kept')
+            return [(label, row) for label, step_value, row in steps]
+
+        time_ = df['TIME'].to_numpy(dtype=float)
+        first_time = df.groupby(df['EVENT'].astype(str), sort=False)['TIME'].first()
+        step_times = first_time.reindex([label for label, step_value, row in steps]).to_numpy(dtype=float)
+        step_times = self.detect_step_times(df, step_times, [(label, step_value) for label, step_value, row in steps])
+        offsets = np.concatenate(([0.], np.asarray(self.tr[:self.n_tr], dtype=float)))
+        instants = step_times[:, None] + offsets[None, :]
+        labels = [label for label in self.get_capture_channels() if label in df.columns]
+        # the initial windows end just before the step row
+        ends = np.nan_to_num(instants)
+        ends[:, 0] = np.nextafter(ends[:, 0], -np.inf)
+        values = self.mra_windows.dataset_average(time_, {label: df[label] for label in labels}, ends)
+
+        rows = []
+        for i, (step_label, step_value, row) in enumerate(steps):
+            if np.isnan(step_times[i]):
+                self.logger.error('Step %s not found in the dataset, live step values kept', step_label)
+                rows.append((step_label, row))
+                continue
+            self.current_step_label = step_label
+            self.set_initial_values({label: values[label][i, 0] for label in labels})
+            self.initial_value['timestamp'] = step_times[i]
+            for tr_iter in range(1, self.n_tr + 1):
+                self.set_tr_values({label: values[label][i, tr_iter] for label in labels}, step_value, tr_iter)
+                self.tr_value[f'timestamp_{tr_iter}'] = instants[i, tr_iter]
+            self.evaluate_criterias()
+            rows.append((step_label, self.write_rslt_sum()))
+        return rows
+
+    def detect_step_times(self, df, event_times, steps):
+        """
+        Moves the step times from the first row of the step events to the first row where the measured
+        voltage has covered half of the step, so the latency between the step command and the voltage change
+        is not counted in the time responses
+        :param df:              dataset DataFrame
+        :param event_times:     time of the first row of each step event (NaN when missing)
+        :param steps:           (step label, voltage) of each step
+        :return:                array of the step times
+        """
+        try:
+            v = np.asarray(self.get_measurement_total(data=df, type_meas='V', log=False), dtype=float)
+        except pAus4777Error:
+            return event_times
+        time_ = df['TIME'].to_numpy(dtype=float)
+        step_times = np.array(event_times, dtype=float)
+        for i, (event_time, (step_label, step_value)) in enumerate(zip(event_times, steps)):
+            if np.isnan(event_time):
+                continue
+            start = int(np.searchsorted(time_, event_time, side='left'))
+            stop = int(np.searchsorted(time_, event_time + self.tr[self.n_tr - 1], side='right'))
+            # voltage over the measurement window before the step event
+            lo = int(np.searchsorted(time_, event_time - self.mra_windows.duration, side='left'))
+            v_initial = np.nanmean(v[lo:start]) if start > lo else v[start]
+            half_step = abs(step_value - v_initial) / 2.
+            if half_step == 0. or np.isnan(half_step):
+                continue
+            reached = np.flatnonzero(np.abs(v[start:stop] - v_initial) >= half_step)
+            if len(reached) > 0:
+                step_times[i] = time_[start + reached[0]]
+            else:
+                self.logger.error('Voltage step of %s not detected in the dataset, step event time used', step_label)
+        return step_times
 
-    def calculate_min_max_values(self, data, function):
-        if function == VV:
+    def get_pwr(self, function):
+        """
+        Power level applied to the curve of the function, 1.0 for the functions not scaled by the power level
+        """
+        if get_function(function).scaled_by_pwr:
+            return self.pwr
+        return 1.0
 
-            v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
-            target_min = self.update_target_value(v_meas + self.MRA['V'] * 1.5, function=VV) - (self.MRA['Q'] * 1.5)
-            target_max = self.update_target_value(v_meas - self.MRA['V'] * 1.5, function=VV) + (self.MRA['Q'] * 1.5)
+    def update_target_value(self, value, function):
+        x, y = get_function(function).get_curve(self.get_params(function=function, region=self.region))
+        y_value = float(np.interp(value, x, y))
+        y_value *= self.get_pwr(function)
+        return round(y_value, 1)
 
-            return target_min, target_max
+    def get_envelope(self, function, region=None):
+        """
+        Returns the envelope table of the function for the region and the power level, built on first use
+        """
+        if region is None:
+            region = self.region
+        function_class = get_function(function)
+        x, y = function_class.get_curve(self.get_params(function=function, region=region))
+        y_tol = self.MRA[function_class.y_meas] * 1.5
+        pwr = self.get_pwr(function)
+        key = (function, region, pwr, tuple(x), tuple(y))
+        if key not in self.envelopes:
+            self.envelopes[key] = EnvelopeTable(x, y, pwr=pwr, v_tol=self.MRA['V'] * 1.5, y_tol=y_tol)
+        return self.envelopes[key]
+
+    def get_evaluator(self, region=None):
+        """
+        Returns the evaluator of all the active functions (y_criteria) for the region and the power level
+        """
+        envelopes = OrderedDict((y, self.get_envelope(function, region)) for y, function in self.y_criteria.items())
+        key = ('evaluator',) + tuple(id(envelope) for envelope in envelopes.values())
+        if key not in self.envelopes:
+            self.envelopes[key] = FunctionEvaluator(envelopes)
+        return self.envelopes[key]
 
-        elif function == VW:
+    def evaluate_functions(self, data):
+        """
+        Pass/fail envelopes of all the active functions at the measured voltage(s)
+        :param data:    measurements (a sample or a dataset with one array per DAQ channel)
+        :return:        OrderedDict {y: (target, min, max)}
+        """
+        v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
+        return self.get_evaluator().evaluate(v_meas)
 
-            v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
-            target_min = self.update_target_value(v_meas + self.MRA['V'] * 1.5, function=VW) - (self.MRA['P'] * 1.5)
-            target_max = self.update_target_value(v_meas - self.MRA['V'] * 1.5, function=VW) + (self.MRA['P'] * 1.5)
+    def get_tolerance_band(self, data, function):
+        """
+        Pass/fail envelope over a complete dataset (e.g. to shade the tolerance band of a chart)
+        :param data:        dataset with one array per DAQ channel
+        :return:            dictionary with the target, min and max arrays
+        """
+        v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
+        envelope = self.get_envelope(function)
+        target_min, target_max = envelope.get_bounds(v_meas)
+        return {'target': envelope.get_target(v_meas), 'min': target_min, 'max': target_max}
+
+def response_time_pass(y, y_initial, y_t1, y_t10, y_final, y_tol):
+    """
+    Response time criteria of CriteriaValidation for scalars or arrays of measured values
+    :return: commencement and completion pass (bool or boolean arrays)
+    """
+    commencement_pass = np.abs(y_t1 - y_initial) >= 2 * y_tol
+    if y == 'P':
+        completion_pass = (y_t10 - y_final) <= 2 * y_tol
+    else:
+        completion_pass = np.abs(y_final - y_t10) <= 2 * y_tol
+    return commencement_pass, completion_pass
 
-            return target_min, target_max
 
 class CriteriaValidation:
     def __init__(self):
-        pass
+        self.monte_carlo = None
+        self.fail_fast = False
+        # set by evaluate_criterias, reset when the next step is recorded
+        self.criterias_evaluated = False
+
+    def set_fail_fast(self, enabled=True):
+        """
+        Enables the fail-fast evaluation of the response time criteria during record_timeresponse()
+        """
+        self.fail_fast = enabled
+
+    def stream_criterias(self, tr_iter):
+        """
+        Evaluates the response time criteria that are decided once the values of Tr tr_iter are recorded:
+        the commencement at the first Tr (only when the step requires a response larger than the tolerance)
+        and the completion at the second Tr.
+        :raise CurveAborted: when a criterion has failed
+        """
+        if not self.fail_fast:
+            return
+        if tr_iter == 1:
+            failed = []
+            for y in list(self.y_criteria.keys()):
+                y_tol = self.s_rated * 0.04
+                y_initial = self.initial_value[y]["y_value"]
+                y_target = self.tr_value[f'{y}_T_COM_TARG_{1}']
+                y_Tcompletion_1s = self.tr_value[f'{y}_T_COM_{1}']
+                commencement_pass = abs(y_Tcompletion_1s - y_initial) >= 2*y_tol
+                self.tr_value[f'{y}_T_COM_{1}_PF'] = 'Pass' if commencement_pass else 'Fail'
+                self.tr_value[f'{y}_T_COM_{2}_PF'] = 'Aborted'
+                self.tr_value[f'{y}_T_COM_{1}_FLIP'] = None
+                self.tr_value[f'{y}_T_COM_{2}_FLIP'] = None
+                if not commencement_pass and abs(y_target - y_initial) >= 2*y_tol:
+                    failed.append(y)
+            if failed:
+                raise CurveAborted(self.current_step_label, f'response commencement failed for {failed}')
+        elif tr_iter == 2:
+            self.evaluate_criterias()
+            failed = [y for y in self.y_criteria.keys() if self.tr_value[f'{y}_T_COM_{2}_PF'] == 'Fail']
+            if failed:
+                raise CurveAborted(self.current_step_label, f'response completion failed for {failed}')
+
+    def set_monte_carlo(self, monte_carlo):
+        """
+        Enables the flip probability columns of the result summary
+        :param monte_carlo: MonteCarloMargins object, None to disable
+        """
+        self.monte_carlo = monte_carlo
+        self.set_result_summary_name()
 
     def evaluate_criterias(self):
         self.response_time_criterias()
+        self.criterias_evaluated = True
 
     def response_time_criterias(self):
         """
@@ -714,29 +1522,30 @@ class CriteriaValidation:
             y_Tcompletion_1s = self.tr_value[f'{y}_T_COM_{1}']
             y_Tcompletion_10s = self.tr_value[f'{y}_T_COM_{2}']
 
-            y_final_eval = abs(y_final - y_Tcompletion_10s)
             y_final_eval_str = f'|{y_final:.2f} - {y_Tcompletion_10s:.2f}| <='  # TODO CHANGED FROM y_Tcompletion_1s
             if y == 'P':
-                self.ts.log_debug('P registered')
-                y_final_eval = y_Tcompletion_10s - y_final
+                self.logger.debug('P registered')
                 y_final_eval_str = f'{y_Tcompletion_10s:.2f} - {y_final:.2f} <='  # TODO CHANGED FROM y_Tcompletion_1s
             else:
-                self.ts.log_debug('Q registered')
+                self.logger.debug('Q registered')
             y_tol = self.s_rated * 0.04
 
 
+            commencement_pass, completion_pass = response_time_pass(y, y_initial, y_Tcompletion_1s,
+                                                                    y_Tcompletion_10s, y_final, y_tol)
             # pass/fail assessment for the response commencement time
-            if abs(y_Tcompletion_1s - y_initial) >= 2*y_tol:
+            if commencement_pass:
                 self.tr_value[f'{y}_T_COM_{1}_PF'] = 'Pass'
             else:
                 self.tr_value[f'{y}_T_COM_{1}_PF'] = 'Fail'
 
-            self.ts.log_debug(f' Response commencement time 1.2s for {y}, evaluation : '
-                              f'|{y_Tcompletion_1s:.2f} - {y_initial:.2f}| >='
-                              f' {2*y_tol:.2f}' + '[%s]' % (self.tr_value[f"{y}_T_COM_{1}_PF"]))
+            self.logger.debug(' Response commencement time 1.2s for %s, evaluation : |%.2f - %.2f| >= %.2f[%s]',
+                              y, y_Tcompletion_1s, y_initial, 2*y_tol, self.tr_value[f'{y}_T_COM_{1}_PF'],
+                              step=self.current_step_label, channel=y, criteria='commencement',
+                              result=self.tr_value[f'{y}_T_COM_{1}_PF'])
 
             # pass/fail assessment for the response completion time
-            if y_final_eval <= 2*y_tol:
+            if completion_pass:
                 self.tr_value[f'{y}_T_COM_{2}_PF'] = 'Pass'
             else:
                 self.tr_value[f'{y}_T_COM_{2}_PF'] = 'Fail'
@@ -745,11 +1554,165 @@ class CriteriaValidation:
             #                  f'|{y_final:.2f} - {y_Tcompletion_1s:.2f}| <='
             #                  f' {2 * y_tol:.2f}' + '[%s]' % (self.tr_value[f"{y}_T_COM_{2}_PF"]))
 
-            self.ts.log_debug(f' Response completion time 10.2s for {y}, evaluation : {y_final_eval_str}'
-                              f' {2 * y_tol:.2f}' + '[%s]' % (self.tr_value[f"{y}_T_COM_{2}_PF"]))
+            self.logger.debug(' Response completion time 10.2s for %s, evaluation : %s %.2f[%s]',
+                              y, y_final_eval_str, 2 * y_tol, self.tr_value[f'{y}_T_COM_{2}_PF'],
+                              step=self.current_step_label, channel=y, criteria='completion',
+                              result=self.tr_value[f'{y}_T_COM_{2}_PF'])
+
+            if self.monte_carlo is not None:
+                flip_1, flip_2 = self.monte_carlo.flip_probability(y, y_initial, y_Tcompletion_1s, y_Tcompletion_10s,
+                                                                   y_final, y_tol, self.MRA[y])
+                self.tr_value[f'{y}_T_COM_{1}_FLIP'] = flip_1
+                self.tr_value[f'{y}_T_COM_{2}_FLIP'] = flip_2
+                self.logger.debug(' Flip probability for %s: commencement %.4f, completion %.4f', y, flip_1, flip_2,
+                                  step=self.current_step_label, channel=y, flip_commencement=flip_1,
+                                  flip_completion=flip_2)
+
+def _flip_counts(args):
+    """
+    Number of perturbed evaluations of a chunk giving the nominal results (run in the process pool)
+    """
+    y, values, y_final, y_tol, mra, n, seed, distribution = args
+    rng = np.random.default_rng(seed)
+    if distribution == MC_UNIFORM:
+        errors = rng.uniform(-mra, mra, size=(3, n))
+    else:
+        # the accuracy is taken as the 95 % interval of a normal distribution
+        errors = rng.normal(0., mra / 2., size=(3, n))
+    y_initial, y_t1, y_t10 = (np.asarray(values)[:, None] + errors)
+    commencement_pass, completion_pass = response_time_pass(y, y_initial, y_t1, y_t10, y_final, y_tol)
+    return int(np.count_nonzero(commencement_pass)), int(np.count_nonzero(completion_pass))
+
+
+class MonteCarloMargins(object):
+    """
+    Probability that the response time criteria of a step flip under the measurement uncertainty. The
+    recorded values (initial, 1 s and 10 s) are perturbed by the minimum required accuracy (MRA) of the
+    measurement and the criteria are evaluated in bulk, in chunks distributed over a process pool.
+    """
+    def __init__(self, n_samples=1000000, workers=1, distribution=MC_NORMAL, chunk_size=250000, seed=None):
+        self.n_samples = int(n_samples)
+        self.workers = workers
+        self.distribution = distribution
+        self.chunk_size = chunk_size
+        self.seed = np.random.SeedSequence(seed)
+        self.pool = None
+
+    def _chunks(self, y, values, y_final, y_tol, mra):
+        sizes = [self.chunk_size] * (self.n_samples // self.chunk_size)
+        if self.n_samples % self.chunk_size:
+            sizes.append(self.n_samples % self.chunk_size)
+        seeds = self.seed.spawn(len(sizes))
+        return [(y, values, y_final, y_tol, mra, n, seed, self.distribution) for n, seed in zip(sizes, seeds)]
+
+    def flip_probability(self, y, y_initial, y_t1, y_t10, y_final, y_tol, mra):
+        """
+        :return: probability that the commencement and the completion results differ from the nominal ones
+        """
+        chunks = self._chunks(y, (y_initial, y_t1, y_t10), y_final, y_tol, mra)
+        if self.workers is not None and self.workers > 1 and len(chunks) > 1:
+            if self.pool is None:
+                self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            counts = list(self.pool.map(_flip_counts, chunks))
+        else:
+            counts = [_flip_counts(chunk) for chunk in chunks]
+        commencement_count, completion_count = np.sum(counts, axis=0)
+        commencement_pass, completion_pass = response_time_pass(y, y_initial, y_t1, y_t10, y_final, y_tol)
+        commencement_ratio = commencement_count / float(self.n_samples)
+        completion_ratio = completion_count / float(self.n_samples)
+        if commencement_pass:
+            commencement_ratio = 1. - commencement_ratio
+        if completion_pass:
+            completion_ratio = 1. - completion_ratio
+        return round(float(commencement_ratio), 6), round(float(completion_ratio), 6)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
 
 class ImbalanceComponent:
-    pass
+    """
+    Three-phase measurement engine. All the values are computed with NumPy so the same methods apply to
+    a single DAQ sample (scalar per channel) or to a complete dataset (one array per channel).
+    """
+    # Phase angles used when the DAQ does not measure them (a-b-c positive sequence)
+    NOMINAL_ANGLES = np.radians([0., -120., 120.])
+
+    # Fortescue transformation: [V0, V1, V2] = FORTESCUE @ [Va, Vb, Vc]
+    _a = np.exp(2j * np.pi / 3.)
+    FORTESCUE = np.array([[1., 1., 1.],
+                          [1., _a, _a**2],
+                          [1., _a**2, _a]]) / 3.
+
+    def get_measurement_phases(self, data, type_meas):
+        """
+        Returns the values of each phase
+        :param data:        DAQ sample (dict) or dataset (pandas DataFrame)
+        :param type_meas:   Either V, P, Q, I, etc.
+        :return:            ndarray with one row per phase
+        """
+        return np.array([np.asarray(data.get(label), dtype=float)
+                         for label in self.get_measurement_label(type_meas)])
+
+    def get_phase_angles(self, data, type_meas='V'):
+        """
+        Returns the phase angles (radians) measured by the DAQ or the nominal angles if they are not available
+        """
+        angles = [data.get(label) for label in self.get_measurement_label(type_meas + '_ANGLE')]
+        if any(angle is None for angle in angles):
+            return self.NOMINAL_ANGLES.reshape((3,) + (1,) * (np.ndim(data.get(self.get_measurement_label(type_meas)[0]))))
+        return np.radians(np.array([np.asarray(angle, dtype=float) for angle in angles]))
+
+    def get_sequence_components(self, data, type_meas='V'):
+        """
+        Computes the zero, positive and negative sequence components from the complex phasors
+        :param data:        DAQ sample (dict) or dataset (pandas DataFrame)
+        :param type_meas:   Either V or I
+        :return:            zero, positive and negative sequence magnitudes
+        """
+        phasors = self.get_measurement_phases(data, type_meas) * np.exp(1j * self.get_phase_angles(data, type_meas))
+        seq = np.tensordot(self.FORTESCUE, phasors, axes=1)
+        return np.abs(seq[0]), np.abs(seq[1]), np.abs(seq[2])
+
+    def get_imbalance_value(self, data, type_meas='V'):
+        """
+        Returns the value the EUT responds to according to eut.imbalance_resp
+        :param data:        DAQ sample (dict) or dataset (pandas DataFrame)
+        :param type_meas:   Either V or I
+        :return:            value (float) or array of values for a dataset
+        """
+        if self.imbalance_resp == IMB_POSITIVE:
+            value = self.get_sequence_components(data, type_meas)[1]
+        elif self.imbalance_resp == IMB_INDIVIDUAL:
+            # The phase with the largest deviation from nominal drives the response
+            values = self.get_measurement_phases(data, type_meas)
+            idx = np.argmax(np.abs(values - self.v_nom), axis=0)
+            value = np.take_along_axis(values, np.expand_dims(idx, axis=0), axis=0)[0]
+        else:
+            value = np.mean(self.get_measurement_phases(data, type_meas), axis=0)
+        if np.ndim(value) == 0:
+            return float(value)
+        return value
+
+    def get_imbalance_dataset(self, data, type_meas='V'):
+        """
+        Evaluates a complete capture in one pass
+        :param data:        dataset (pandas DataFrame) with the phase channels
+        :param type_meas:   Either V or I
+        :return:            DataFrame with the phase values, the average, the sequence components and
+                            the unbalance factor (negative/positive sequence in %)
+        """
+        values = self.get_measurement_phases(data, type_meas)
+        zero, pos, neg = self.get_sequence_components(data, type_meas)
+        result = pd.DataFrame(values.T, columns=self.get_measurement_label(type_meas))
+        result[f'{type_meas}_AVG'] = values.mean(axis=0)
+        result[f'{type_meas}_ZERO'] = zero
+        result[f'{type_meas}_POS'] = pos
+        result[f'{type_meas}_NEG'] = neg
+        result[f'{type_meas}_UNBALANCE'] = np.divide(neg, pos, out=np.zeros_like(neg), where=pos != 0) * 100.
+        return result
 
 """
 Section reserved for HIL model object
@@ -763,6 +1726,7 @@ class HilModel(object):
         self.ts = ts
         self.start_time = None
         self.stop_time = None
+        self.pending_params = collections.OrderedDict()
         if support_interfaces.get('hil') is not None:
             self.hil = support_interfaces.get('hil')
         else:
@@ -772,8 +1736,101 @@ class HilModel(object):
         """
         Set the HIL model on
         """
-        model_name = self.params["model_name"]
-        self.hil.set_params(model_name + "/SM_Source/SVP Commands/mode/Value", 3)
+        self.queue_model_mode(3)
+        self.flush_params(verify=False)
+
+    def model_path(self, name):
+        return self.params["model_name"] + "/SM_Source/SVP Commands/" + name + "/Value"
+
+    """
+    Queued parameter writes, sent to the HIL in a single call by flush_params()
+    """
+
+    def queue_param(self, path, value):
+        self.pending_params[path] = value
+
+    def queue_model_mode(self, mode):
+        self.queue_param(self.model_path('mode'), mode)
+
+    def queue_curve(self, function, pairs):
+        """
+        :param function:    function name (e.g. VW, VV)
+        :param pairs:       curve points dictionary (e.g. {'Vw1': 253., 'P1': 8000., ...})
+        """
+        for key, value in pairs.items():
+            self.queue_param(self.model_path(f'{function}/{key}'), value)
+
+    def queue_voltage_profile(self, times, voltages):
+        """
+        :param times:       list of times (s) of the voltage profile points
+        :param voltages:    list of voltages (V) of the voltage profile points
+        """
+        self.queue_param(self.model_path('v_profile/time'), list(times))
+        self.queue_param(self.model_path('v_profile/voltage'), list(voltages))
+
+    def queue_waveform_window(self, current_mode, offset=0.):
+        config = self.get_waveform_config(current_mode, offset)
+        self.queue_param(self.model_path(config["start_time_variable"]), config["start_time_value"])
+        self.queue_param(self.model_path(config["end_time_variable"]), config["end_time_value"])
+
+    def flush_params(self, verify=True):
+        """
+        Writes all the queued parameters in one batched call and verifies them with one batched readback
+        :param verify:  read the parameters back and compare them with the written values
+        :return:        dictionary of the written parameters
+        """
+        written = collections.OrderedDict(self.pending_params)
+        self.pending_params.clear()
+        if not written:
+            return written
+        pairs = tuple(written.items())
+        if self.supports_batched_params():
+            self.hil.set_params(pairs)
+        else:
+            for path, value in pairs:
+                self.hil.set_params(path, value)
+
+        if verify and hasattr(self.hil, 'get_params'):
+            paths = tuple(written.keys())
+            readback = self.hil.get_params(paths)
+            if not isinstance(readback, dict):
+                readback = dict(zip(paths, readback))
+            mismatch = {path: (value, readback.get(path)) for path, value in written.items()
+                        if not self.param_equal(value, readback.get(path))}
+            if mismatch:
+                raise pAus4777Error(f'HIL parameters readback mismatch (written, read): {mismatch}')
+        self.ts.log_debug(f'{len(written)} HIL parameters written')
+        return written
+
+    def supports_batched_params(self):
+        """
+        True if the HIL driver writes a tuple of (path, value) pairs in one call: the driver declares it with
+        batched_params or its set_params(parameters, value=None) has an optional value
+        """
+        batched = getattr(self.hil, 'batched_params', None)
+        if batched is not None:
+            return bool(batched)
+        try:
+            signature = inspect.signature(self.hil.set_params)
+        except (TypeError, ValueError):
+            return False
+        value = signature.parameters.get('value')
+        return value is not None and value.default is not inspect.Parameter.empty
+
+    @staticmethod
+    def param_equal(written, read):
+        """
+        Compares a written parameter with its readback, numbers and lists of numbers with a float tolerance
+        (a list may be read back as a tuple or an array)
+        """
+        if read is None:
+            return written is None
+        try:
+            written_values = np.asarray(written, dtype=float)
+            read_values = np.asarray(read, dtype=float)
+        except (TypeError, ValueError):
+            return written == read
+        return written_values.shape == read_values.shape and np.allclose(written_values, read_values)
 
     """
     Getter functions
@@ -791,16 +1848,757 @@ class HilModel(object):
         params["end_time_variable"] = "Tend"
         return params
 
+class SimulatedHil(object):
+    """
+    Local stand-in for a HIL target. Every call is one round-trip with an optional latency and the
+    number of round-trips is counted so batched and single writes can be compared.
+    """
+    batched_params = True
+
+    def __init__(self, latency=0.):
+        self.latency = latency
+        self.values = {}
+        self.round_trips = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def set_params(self, parameters, value=None):
+        self._round_trip()
+        if value is None:
+            for path, path_value in parameters:
+                self.values[path] = path_value
+        else:
+            self.values[parameters] = value
+
+    def get_params(self, parameters):
+        self._round_trip()
+        if isinstance(parameters, (tuple, list)):
+            return tuple(self.values.get(path) for path in parameters)
+        return self.values.get(parameters)
+
+    def close(self):
+        pass
+
+"""
+Section reserved for waveform processing (HIL or waveform file captures)
+"""
+
+class WaveformProcessor(object):
+    """
+    Streaming conversion of raw voltage/current waveforms into per-cycle RMS, active and reactive power.
+    The blocks are cut in cycle-synchronous windows of f_nom and all the cycles of a block are computed at
+    once with NumPy. The samples of an incomplete cycle are kept for the next block so a long capture can
+    be processed in chunks. The output uses the DAQ channel names (AC_VRMS_n, AC_IRMS_n, AC_P_n, AC_Q_n,
+    AC_S_n) so it can be used directly with get_measurement_total.
+    """
+    def __init__(self, f_nom, sample_rate, phases=3, time_label='TIME', v_label='AC_V', i_label='AC_I'):
+        """
+        :param f_nom:       nominal frequency (Hz)
+        :param sample_rate: waveform sampling rate (Hz)
+        :param phases:      number of phases
+        :param time_label:  name of the time column of the waveform
+        :param v_label:     root name of the voltage waveform columns (e.g. AC_V_1)
+        :param i_label:     root name of the current waveform columns (e.g. AC_I_1)
+        """
+        self.samples_per_cycle = int(round(sample_rate / f_nom))
+        if self.samples_per_cycle < 4:
+            raise pAus4777Error(f'Waveform sample rate {sample_rate} Hz too low for {f_nom} Hz')
+        self.phases = phases
+        self.time_label = time_label
+        self.v_labels = [f'{v_label}_{i}' for i in range(1, phases + 1)]
+        self.i_labels = [f'{i_label}_{i}' for i in range(1, phases + 1)]
+        self._carry = None
+
+    def reset(self):
+        self._carry = None
+
+    def process_block(self, block):
+        """
+        Computes the per-cycle values of a block of waveform samples
+        :param block:   DataFrame (or dict of arrays) with the time, voltage and current columns
+        :return:        DataFrame with one row per complete cycle
+        """
+        block = pd.DataFrame(block)
+        if self._carry is not None:
+            block = pd.concat([self._carry, block], ignore_index=True)
+        n = self.samples_per_cycle
+        n_cycles = len(block) // n
+        self._carry = block.iloc[n_cycles * n:].reset_index(drop=True)
+        if n_cycles == 0:
+            return pd.DataFrame()
+        block = block.iloc[:n_cycles * n]
+
+        # arrays shaped (phases, cycles, samples per cycle)
+        v = block[self.v_labels].to_numpy(dtype=float).T.reshape(self.phases, n_cycles, n)
+        i = block[self.i_labels].to_numpy(dtype=float).T.reshape(self.phases, n_cycles, n)
+        v_rms = np.sqrt(np.mean(v * v, axis=2))
+        i_rms = np.sqrt(np.mean(i * i, axis=2))
+        p = np.mean(v * i, axis=2)
+        # voltage delayed by a quarter cycle, positive Q when the current lags the voltage
+        q = np.mean(np.roll(v, n // 4, axis=2) * i, axis=2)
+
+        result = pd.DataFrame({self.time_label: block[self.time_label].to_numpy()[::n]})
+        for ph in range(self.phases):
+            result[f'AC_VRMS_{ph + 1}'] = v_rms[ph]
+            result[f'AC_IRMS_{ph + 1}'] = i_rms[ph]
+            result[f'AC_P_{ph + 1}'] = p[ph]
+            result[f'AC_Q_{ph + 1}'] = q[ph]
+            result[f'AC_S_{ph + 1}'] = v_rms[ph] * i_rms[ph]
+        return result
+
+    def process(self, blocks):
+        """
+        Generator processing an iterable of waveform blocks (e.g. HIL captures between Tstart and Tend)
+        """
+        self.reset()
+        for block in blocks:
+            result = self.process_block(block)
+            if len(result) > 0:
+                yield result
+
+    def process_file(self, filename, chunksize=100000):
+        """
+        Generator processing a waveform csv file in chunks of chunksize rows
+        """
+        return self.process(pd.read_csv(filename, chunksize=chunksize))
+
+    def to_csv(self, blocks, filename):
+        """
+        Writes the per-cycle values of all the blocks in a csv file
+        :return: number of cycles written
+        """
+        cycles = 0
+        header = True
+        for result in self.process(blocks):
+            result.to_csv(filename, mode='w' if header else 'a', header=header, index=False)
+            header = False
+            cycles += len(result)
+        return cycles
+
+"""
+Section reserved for the voltage step program executed autonomously by the grid simulator
+"""
+
+class VoltageProgram(object):
+    """
+    Timed voltage program (list/sequence mode). The grid simulator driver executes the program by itself
+    after the trigger so the voltage steps do not depend on the script command latency.
+    The driver needs voltage_sequence(times, voltages), sequence_arm() and sequence_trigger().
+    """
+    def __init__(self):
+        # [(step_label, start time (s) from trigger, voltage (V))]
+        self.points = []
+        self.duration = 0.
+        self.trigger_time = None
+
+    def add_step(self, step_label, voltage, hold_time):
+        self.points.append((step_label, self.duration, voltage))
+        self.duration += hold_time
+
+    def get_times(self):
+        return [t for label, t, v in self.points]
+
+    def get_voltages(self):
+        return [v for label, t, v in self.points]
+
+    def get_step_time(self, step_label):
+        """
+        Returns the datetime of a step once the program has been triggered
+        """
+        for label, t, v in self.points:
+            if label == step_label:
+                return self.trigger_time + timedelta(seconds=t)
+        raise pAus4777Error(f'Step {step_label} not in voltage program')
+
+    @staticmethod
+    def is_supported(grid):
+        return grid is not None and all(hasattr(grid, attr) for attr in
+                                        ('voltage_sequence', 'sequence_arm', 'sequence_trigger'))
+
+    def get_end_time(self):
+        """
+        Returns the datetime at which the program ends once it has been triggered
+        """
+        return self.trigger_time + timedelta(seconds=self.duration)
+
+    def arm(self, grid):
+        grid.voltage_sequence(self.get_times(), self.get_voltages())
+        grid.sequence_arm()
+
+    def trigger(self, grid):
+        """
+        Starts the program, the step timestamps are referenced to the trigger
+        :return: trigger datetime
+        """
+        trigger_time = grid.sequence_trigger()
+        if trigger_time is None:
+            trigger_time = datetime.now()
+        self.trigger_time = trigger_time
+        return trigger_time
+
+
+class SimulatedGridSim(object):
+    """
+    Local stand-in grid simulator executing a voltage program in a background thread.
+    The applied voltages are kept in history as (datetime, voltage) for testing.
+    """
+    def __init__(self, v_nom=230.):
+        self.v = v_nom
+        self.history = []
+        self._times = []
+        self._voltages = []
+        self._armed = False
+        self._thread = None
+
+    def voltage(self, voltage=None):
+        if voltage is not None:
+            self.v = voltage
+            self.history.append((datetime.now(), voltage))
+        return self.v
+
+    def voltage_sequence(self, times, voltages):
+        self._times = list(times)
+        self._voltages = list(voltages)
+        self._armed = False
+
+    def sequence_arm(self):
+        self._armed = True
+
+    def sequence_trigger(self):
+        if not self._armed:
+            raise pAus4777Error('Voltage sequence not armed')
+        trigger_time = datetime.now()
+        self._thread = threading.Thread(target=self._run, args=(trigger_time,), daemon=True)
+        self._thread.start()
+        return trigger_time
+
+    def _run(self, trigger_time):
+        for t, v in zip(self._times, self._voltages):
+            delay = (trigger_time + timedelta(seconds=t) - datetime.now()).total_seconds()
+            if delay > 0:
+                time.sleep(delay)
+            self.voltage(v)
+        self._armed = False
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self):
+        self.wait()
+
+"""
+Section reserved for the DER (EUT) interface cache
+"""
+
+# Tolerances of the comparison of the written EUT settings with the readback (percentages rounded by the EUT)
+DER_VERIFY_RTOL = 1e-3
+DER_VERIFY_ATOL = 0.05
+
+
+class DerCache(object):
+    """
+    Caching layer around the svpelab DER interface for the curve functions (volt_var, volt_watt).
+    The last written parameters are kept so that only the parameters that differ are written to the EUT.
+    The last settings read back from the EUT are kept separately and used for logging until the next write
+    or until verification is requested. All the other attributes are forwarded to the DER object.
+    """
+    def __init__(self, eut, ts=None):
+        self.eut = eut
+        self.ts = ts
+        self.written = {}
+        self.readback = {}
+
+    def __getattr__(self, name):
+        return getattr(self.eut, name)
+
+    def volt_var(self, params=None, verify=False):
+        return self._curve_function('volt_var', params=params, verify=verify)
+
+    def volt_watt(self, params=None, verify=False):
+        return self._curve_function('volt_watt', params=params, verify=verify)
+
+    def invalidate(self, function=None):
+        if function is None:
+            self.written.clear()
+            self.readback.clear()
+        else:
+            self.written.pop(function, None)
+            self.readback.pop(function, None)
+
+    def _curve_function(self, function, params=None, verify=False):
+        der_function = getattr(self.eut, function)
+        if params is None:
+            if verify or function not in self.readback:
+                self.readback[function] = der_function()
+                if verify:
+                    self._verify(function)
+            return self.readback[function]
+
+        changes = self._diff(params, self.written.get(function, {}))
+        if changes:
+            der_function(params=changes)
+            self._merge(self.written.setdefault(function, {}), changes)
+            # the settings applied by the EUT are read again on the next readback
+            self.readback.pop(function, None)
+        elif self.ts is not None:
+            self.ts.log_debug(f'EUT {function} settings unchanged, write skipped')
+        return changes
+
+    def _verify(self, function):
+        written = self._normalise(self.written.get(function, {}))
+        readback = self._normalise(self.readback[function] or {})
+        mismatch = {}
+        for key, value in written.items():
+            if key in readback and self._match(value, readback[key]) is False:
+                mismatch[key] = (value, readback[key])
+        if mismatch:
+            raise pAus4777Error(f'EUT {function} readback differs from written settings (written, read): {mismatch}')
+
+    @classmethod
+    def _normalise(cls, settings, prefix=''):
+        """
+        Flattens the settings to {key: value} with lower case keys. The curve points written as lists and read
+        back as numbered keys give the same keys ({'curve': {'v': [95, 105]}} and {'curve': {'v1': 95,
+        'v2': 105}} both give curve.v.0 and curve.v.1).
+        """
+        if isinstance(settings, dict):
+            items = settings.items()
+        else:
+            items = enumerate(settings)
+        flat = {}
+        for key, value in items:
+            key = str(key).lower()
+            point = re.match(r'^([a-z_]+?)(\d+)$', key)
+            if prefix and point is not None:
+                key = '%s.%d' % (point.group(1), int(point.group(2)) - 1)
+            name = '%s.%s' % (prefix, key) if prefix else key
+            if isinstance(value, (dict, list, tuple)):
+                flat.update(cls._normalise(value, name))
+            else:
+                flat[name] = value
+        return flat
+
+    @staticmethod
+    def _match(written, read):
+        """
+        :return: True or False, None when the values are not comparable (e.g. a curve name read back as the
+                 curve number)
+        """
+        if isinstance(written, bool) or isinstance(read, bool):
+            return bool(written) == bool(read)
+        try:
+            return bool(np.isclose(float(written), float(read), rtol=DER_VERIFY_RTOL, atol=DER_VERIFY_ATOL))
+        except (TypeError, ValueError):
+            pass
+        if isinstance(written, str) and isinstance(read, str):
+            return written.strip().lower() == read.strip().lower()
+        return None
+
+    @staticmethod
+    def _diff(params, state):
+        """
+        Returns the parameters that differ from state. A curve is written as a whole (all its points)
+        when any of its points differs.
+        """
+        return {key: value for key, value in params.items() if key not in state or state[key] != value}
+
+    @staticmethod
+    def _merge(state, changes):
+        state.update(changes)
+
+"""
+Section reserved for the progress journal used to resume interrupted tests
+"""
+
+class ProgressJournal(object):
+    """
+    Persisted progress of a test: for each curve (dataset name), the completed step labels, the result
+    summary rows already written and the dataset already saved. A rerun can then resume at the next
+    uncompleted step and continue the existing dataset and summary.
+    The journal holds the hash of the test parameters it was written with; a journal written with other
+    parameters (or without a hash) is discarded and the test starts fresh.
+    """
+    def __init__(self, filename, params=None):
+        """
+        :param filename:    journal file (json)
+        :param params:      dictionary of the test parameters the results depend on (curves, v_nom, ...)
+        """
+        self.filename = filename
+        self.params_hash = self.hash_params(params or {})
+        self.curves = {}
+        self.discarded = False
+        try:
+            with open(self.filename) as f:
+                journal = json.load(f)
+        except (IOError, ValueError):
+            journal = None
+        if journal is not None:
+            if isinstance(journal, dict) and journal.get('params_hash') == self.params_hash:
+                self.curves = journal.get('curves', {})
+            else:
+                self.discarded = True
+                os.remove(self.filename)
+
+    @staticmethod
+    def hash_params(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _curve(self, curve):
+        return self.curves.setdefault(curve, {'completed': [], 'rows': [], 'dataset': None, 'done': False})
+
+    def _save(self):
+        # write then replace so an interruption never leaves a truncated journal
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({'params_hash': self.params_hash, 'curves': self.curves}, f, indent=1)
+        os.replace(tmp_filename, self.filename)
+
+    def is_curve_done(self, curve):
+        return self.curves.get(curve, {}).get('done', False)
+
+    def is_completed(self, curve, step_label):
+        return step_label in self.curves.get(curve, {}).get('completed', [])
+
+    def get_completed(self, curve):
+        return list(self.curves.get(curve, {}).get('completed', []))
+
+    def get_rows(self):
+        return [row for curve in self.curves.values() for row in curve['rows']]
+
+    def step_completed(self, curve, step_label, row=None):
+        """
+        :param row: result summary row of the step, None for the steps without measurements (C, H)
+        """
+        entry = self._curve(curve)
+        entry['completed'].append(step_label)
+        if row is not None:
+            entry['rows'].append(row)
+        self._save()
+
+    def curve_completed(self, curve):
+        self._curve(curve)['done'] = True
+        self._save()
+
+    def save_dataset(self, curve, ds, filename):
+        """
+        Saves the dataset of a curve. When a previous run saved part of the curve, the file holds the rows of
+        the previous dataset followed by the new rows, their TIME shifted to continue after the previous
+        capture; the previous dataset file is not modified.
+        :param ds:          dataset from daq.data_capture_dataset()
+        :param filename:    full path of the csv file
+        """
+        entry = self._curve(curve)
+        if entry['dataset'] is not None and os.path.exists(entry['dataset']):
+            tmp_filename = filename + '.part'
+            ds.to_csv(tmp_filename)
+            try:
+                previous = pd.read_csv(entry['dataset'], skipinitialspace=True)
+                new = pd.read_csv(tmp_filename, skipinitialspace=True)
+            finally:
+                os.remove(tmp_filename)
+            if 'TIME' in previous.columns and 'TIME' in new.columns and len(previous) > 0 and len(new) > 0:
+                # the new capture starts one sample period after the end of the previous one
+                period = previous['TIME'].diff().median() if len(previous) > 1 else 0.
+                if np.isnan(period):
+                    period = 0.
+                new['TIME'] += previous['TIME'].iloc[-1] + period - new['TIME'].iloc[0]
+            # written then renamed, the previous dataset may be the same file
+            tmp_filename = filename + '.tmp'
+            pd.concat([previous, new], ignore_index=True, sort=False).to_csv(tmp_filename, index=False)
+            os.replace(tmp_filename, filename)
+        else:
+            ds.to_csv(filename)
+        entry['dataset'] = filename
+        self._save()
+
+    def clear(self):
+        self.curves = {}
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+"""
+Section reserved for the capture sources read by DataLogging instead of sampling the DAQ on demand
+"""
+
+class CaptureRing(object):
+    """
+    Ring buffer of fixed-layout capture records (timestamp followed by one value per channel) written by a
+    single producer. read() returns a copy of the records of a time range, the records overwritten by the
+    producer before the copy is complete are dropped.
+    """
+    def __init__(self, channels, capacity=100000, buffer=None):
+        """
+        :param channels:    channel labels of the records (e.g. ['AC_VRMS_1', 'AC_P_1'])
+        :param capacity:    number of records kept
+        :param buffer:      memory holding the ring (default: private memory)
+        """
+        self.channels = list(channels)
+        self.capacity = capacity
+        self.width = len(self.channels) + 1
+        if buffer is None:
+            buffer = bytearray(self.nbytes(len(self.channels), capacity))
+        # write counter followed by the records
+        self.header = np.ndarray((1,), dtype=np.int64, buffer=buffer)
+        self.records = np.ndarray((capacity, self.width), dtype=np.float64, buffer=buffer, offset=8)
+        self.index = {label: i + 1 for i, label in enumerate(self.channels)}
+
+    @staticmethod
+    def nbytes(n_channels, capacity):
+        return 8 + capacity * (n_channels + 1) * 8
+
+    def push(self, timestamp, data):
+        """
+        Adds a record, data is a dictionary of the channel values (missing channels are NaN)
+        """
+        count = int(self.header[0])
+        row = self.records[count % self.capacity]
+        row[0] = timestamp
+        for label, i in self.index.items():
+            value = data.get(label)
+            row[i] = np.nan if value is None else value
+        # the record is complete before it is published
+        self.header[0] = count + 1
+
+    def __len__(self):
+        return min(int(self.header[0]), self.capacity)
+
+    def read(self, start_time=None, end_time=None):
+        """
+        :return: timestamps and values (one column per channel) of the records in [start_time, end_time],
+                 copied from the ring
+        """
+        count = int(self.header[0])
+        first = max(0, count - self.capacity)
+        # records first to count - 1 as at most two contiguous segments of the buffer
+        segments = []
+        n = first
+        while n < count:
+            pos = n % self.capacity
+            length = min(count - n, self.capacity - pos)
+            segments.append((n, self.records[pos:pos + length]))
+            n += length
+        selected = []
+        for n, records in segments:
+            timestamps = records[:, 0]
+            lo = 0 if start_time is None else np.searchsorted(timestamps, start_time, side='left')
+            hi = len(timestamps) if end_time is None else np.searchsorted(timestamps, end_time, side='right')
+            if hi > lo:
+                selected.append((n + lo, records[lo:hi]))
+        if not selected:
+            return np.empty(0), np.empty((0, self.width - 1))
+        records = np.concatenate([records for n, records in selected])
+        # records overwritten (or being overwritten) by the producer before the copy was complete
+        overwritten = int(self.header[0]) - self.capacity - selected[0][0] + 1
+        if overwritten > 0:
+            records = records[overwritten:]
+        return records[:, 0], records[:, 1:]
+
+    def value_at(self, timestamp, span=1.):
+        """
+        Channel values at an exact instant, interpolated between the two neighbouring records
+        :param timestamp:   instant (timestamp in s)
+        :param span:        maximum distance (s) of the neighbouring records
+        :return: dictionary of the channel values, None if there is no record around the instant
+        """
+        timestamps, values = self.read(timestamp - span, timestamp + span)
+        if len(timestamps) == 0:
+            return None
+        i = int(np.searchsorted(timestamps, timestamp))
+        if i == 0:
+            row = values[0]
+        elif i == len(timestamps):
+            row = values[-1]
+        else:
+            weight = (timestamp - timestamps[i - 1]) / (timestamps[i] - timestamps[i - 1])
+            row = values[i - 1] * (1. - weight) + values[i] * weight
+        return dict(zip(self.channels, row.tolist()))
+
+    def latest(self):
+        """
+        :return: the last record as a dictionary, None if the ring is empty
+        """
+        count = int(self.header[0])
+        if count == 0:
+            return None
+        row = self.records[(count - 1) % self.capacity]
+        return dict(zip(self.channels, row[1:].tolist()))
+
+
+class _SerializedSc(object):
+    """
+    Soft channel dictionary of a SerializedDaq, the updates hold the DAQ lock
+    """
+    def __init__(self, sc, lock):
+        self._sc = sc
+        self._lock = lock
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            self._sc[name] = value
+
+    def __getitem__(self, name):
+        with self._lock:
+            return self._sc[name]
+
+    def __contains__(self, name):
+        return name in self._sc
+
+    def __iter__(self):
+        return iter(list(self._sc))
+
+    def __len__(self):
+        return len(self._sc)
+
+    def get(self, name, default=None):
+        with self._lock:
+            return self._sc.get(name, default)
+
+    def keys(self):
+        return list(self._sc.keys())
+
+    def update(self, values):
+        # all the soft channels of a frame are written at once
+        with self._lock:
+            self._sc.update(values)
+
+
+class SerializedDaq(object):
+    """
+    Proxy of a DAQ shared by the script and a sampling thread. The svpelab DAQ drivers are not thread-safe:
+    every method call and soft channel update of the proxy holds the lock of the sampler, so a capture row
+    never mixes the soft channels of two frames.
+    """
+    def __init__(self, daq, lock):
+        self._daq = daq
+        self._lock = lock
+        self.sc = _SerializedSc(daq.sc, lock)
+
+    def __getattr__(self, name):
+        attr = getattr(self._daq, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+class AcquisitionThread(object):
+    """
+    Background thread sampling the DAQ at a fixed rate into a timestamped CaptureRing, so the sampling
+    instants do not depend on when the script wakes up. The values at an exact instant are interpolated
+    between the buffered samples (value_at).
+    The sampler owns the DAQ lock: the script uses the serialized proxy (daq) while the thread is running,
+    and the thread runs only while the DAQ captures (start() after data_capture(True), stop() before
+    data_capture(False)).
+    """
+    def __init__(self, daq, channels, rate=None, capacity=100000, f_nom=50.):
+        """
+        :param daq:         data acquisition object from svpelab library
+        :param channels:    channel labels buffered (all the channels read by get_measurement_total)
+        :param rate:        sampling rate (Hz), default one sample per cycle of f_nom
+        """
+        self.device = daq
+        self.lock = threading.RLock()
+        self.daq = SerializedDaq(daq, self.lock)
+        self.channels = list(channels)
+        self.rate = rate if rate is not None else f_nom
+        self.ring = CaptureRing(self.channels, capacity=capacity)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='p4777-acquisition', daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        period = 1. / self.rate
+        next_time = time.time()
+        while not self.stop_event.is_set():
+            try:
+                with self.lock:
+                    self.device.data_sample()
+                    data = self.device.data_capture_read()
+                self.ring.push(time.time(), data)
+            except Exception as e:
+                self.error = e
+                return
+            next_time += period
+            delay = next_time - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_time = time.time()
+
+    def _check(self):
+        if self.error is not None:
+            raise pAus4777Error('Acquisition thread stopped: %s' % self.error)
+
+    def read(self, start_time=None, end_time=None):
+        self._check()
+        return self.ring.read(start_time, end_time)
+
+    def latest(self):
+        self._check()
+        return self.ring.latest()
+
+    def value_at(self, timestamp, span=1.):
+        self._check()
+        return self.ring.value_at(timestamp, span=span)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(5.)
+
+    def close(self):
+        self.stop()
+
+
+"""
+Section reserved for the registry of the power quality functions used by ActiveFunction
+"""
+
+# {function: class}, a class provides the function parameters (set_params), the criteria (x_criteria,
+# y_criteria, meas_values) and the characteristic curve of a region (get_curve)
+FUNCTIONS = OrderedDict()
+
+
+def register_function(function_class):
+    FUNCTIONS[function_class.function] = function_class
+    return function_class
+
+
+def get_function(function):
+    if function not in FUNCTIONS:
+        raise pAus4777Error('Function %s is not registered' % function)
+    return FUNCTIONS[function]
+
+
 """
 This section is for Voltage stabilization function such as VV, VW, CPF and CRP
 """
 
 #class VoltVar(EutParameters, UtilParameters, DataLogging, CriteriaValidation):
+@register_function
 class VoltVar(EutParameters):
 
+    function = VV
     meas_values = ['V', 'Q', 'P']
     x_criteria = ['V']
     y_criteria = {'Q': VV}
+    y_meas = 'Q'
+    # the reactive power curve does not depend on the available active power
+    scaled_by_pwr = False
     script_complete_name = 'Volt-Var'
 
     def __init__(self, ts):
@@ -855,39 +2653,28 @@ class VoltVar(EutParameters):
         self.ts.log_debug(f'{self.param[VV]}')
 
 
+    @staticmethod
+    def get_curve(pairs):
+        return ([pairs['Vv1'], pairs['Vv2'], pairs['Vv3'], pairs['Vv4']],
+                [pairs['Q1'], pairs['Q2'], pairs['Q3'], pairs['Q4']])
+
     def create_vv_dict_steps(self, mode=None, secondary_pairs=None):
         pass
 
-    def update_target_value(self, value):
-
-        x = [self.param[self.region]['Vv1'], self.param[self.region]['Vv2'],
-             self.param[self.region]['Vv3'], self.param[self.region]['Vv4']]
-        y = [self.param[self.region]['Q1'], self.param[self.region]['Q2'],
-             self.param[self.region]['Q3'], self.param[self.region]['Q4']]
-        q_value = float(np.interp(value, x, y))
-        q_value *= self.pwr
-        return round(q_value, 1)
-
-    def update_measure_value(self, data, daq):
-
-        daq.sc['V_MEAS'] = self.get_measurement_total(data=data, type_meas='V', log=False)
-        daq.sc['P_MEAS'] = self.get_measurement_total(data=data, type_meas='P', log=False)
-        daq.sc['Q_MEAS'] = self.get_measurement_total(data=data, type_meas='Q', log=False)
-
-    def calculate_min_max_values(self, daq, data):
-        v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
-        target_min = self.update_target_value(v_meas) - 0.04*self.s_rated
-        target_max = self.update_target_value(v_meas) + 0.04*self.s_rated
-
 
+@register_function
 class VoltWatt():
 
     """
     param curve: choose curve characterization [1-3] 1 is default
     """
+    function = VW
     meas_values = ['V', 'Q', 'P']
     x_criteria = ['V']
     y_criteria = {'P': VW}
+    y_meas = 'P'
+    # the active power curve is scaled to the available power (power level sweep)
+    scaled_by_pwr = True
     script_complete_name = 'Volt-Watt'
 
     def __init__(self, ts):
@@ -934,6 +2721,10 @@ class VoltWatt():
         self.ts.log(f'param={self.param[VW]}')
         #return self.param[region]
 
+    @staticmethod
+    def get_curve(pairs):
+        return [pairs['Vw1'], pairs['Vw2']], [pairs['P1'], pairs['P2']]
+
     def create_vw_dict_steps(self, mode=None, secondary_pairs=None):
         """
         Function to create dictionnary depending on which mode volt-watt is running
@@ -994,60 +2785,44 @@ class VoltWatt():
             self.ts.log(f'v_step_dict={v_steps_dict}')
 
         return v_steps_dict
-      
-    def update_target_value(self, value):
-
-        x = [self.param[self.region]['Vw1'], self.param[self.region]['Vw2']]
-        y = [self.param[self.region]['P1'], self.param[self.region]['P2']]
-        q_value = float(np.interp(value, x, y))
-        q_value *= self.pwr
-        return round(q_value, 1)
-
-    def update_measure_value(self, data, daq):
-
-        daq.sc['V_MEAS'] = self.get_measurement_total(data=data, type_meas='V', log=False)
-        daq.sc['P_MEAS'] = self.get_measurement_total(data=data, type_meas='P', log=False)
-        daq.sc['Q_MEAS'] = self.get_measurement_total(data=data, type_meas='Q', log=False)
 
-    def calculate_min_max_values(self, daq, data):
-        v_meas = self.get_measurement_total(data=data, type_meas='V', log=False)
-        target_min = self.update_target_value(v_meas) - 0.04 * self.s_rated
-        target_max = self.update_target_value(v_meas) + 0.04 * self.s_rated
 
-class ActiveFunction(EutParameters, DataLogging, UtilParameters, CriteriaValidation, VoltWatt):
+class ActiveFunction(EutParameters, DataLogging, UtilParameters, CriteriaValidation, ImbalanceComponent):
     """
     This class acts as the main function
     As multiple functions might be needed for a compliance script, this function will inherit
     of all functions if needed.
     """
-    def __init__(self, ts, functions):
+    def __init__(self, ts, functions, log_level=None):
         # Values defined as target/step values which will be controlled as step
         x_criterias = []
         # Values defined as values which will be controlled as step
         y_criterias = []
         self.param = {}
         EutParameters.__init__(self, ts)
-        UtilParameters.__init__(self)
-        self.ts.log(f'Functions to be activated in this test script = {functions}')
+        UtilParameters.__init__(self, log_level=log_level)
+        self.logger.info('Functions to be activated in this test script = %s', functions)
         self.y_criteria={}
 
-        if VW in functions:
-            VoltWatt.__init__(self, ts)
-            x_criterias += VoltWatt.x_criteria
-            self.y_criteria.update(VoltWatt.y_criteria)
-        if VV in functions:
-            VoltVar.__init__(self, ts)
-            x_criterias += VoltVar.x_criteria
-            self.y_criteria.update(VoltVar.y_criteria)
+        for function in functions:
+            function_class = get_function(function)
+            function_class.__init__(self, ts)
+            x_criterias += function_class.x_criteria
+            self.y_criteria.update(function_class.y_criteria)
 
         #Remove duplicates
         self.x_criteria = list(OrderedDict.fromkeys(x_criterias))
         #self.y_criteria=list(OrderedDict.fromkeys(y_criterias))
         self.meas_values = list(OrderedDict.fromkeys(x_criterias+list(self.y_criteria.keys())))
 
+        self.script_complete_name = get_function(functions[0]).script_complete_name
+
         DataLogging.__init__(self)
         CriteriaValidation.__init__(self)
 
+    def create_vw_dict_steps(self, mode=None, secondary_pairs=None):
+        return get_function(VW).create_vw_dict_steps(self, mode=mode, secondary_pairs=secondary_pairs)
+
 if __name__ == "__main__":
     pass
 
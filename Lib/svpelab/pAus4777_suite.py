@@ -0,0 +1,671 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+
+import os
+import sys
+import ast
+import glob
+import json
+import hashlib
+import argparse
+import collections
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+from svpelab import pAus4777
+
+"""
+Offline tools for the DR AS/NZS 4777.2 suites (.ste) and tests (.tst): the configurations are expanded with
+the script defaults and the suite globals, and the step plans are built with the pAus4777 library without
+any equipment connected.
+"""
+
+SUITE_EXT = '.ste'
+TEST_EXT = '.tst'
+
+param_types = {'int': int, 'float': float, 'string': str, 'bool': bool}
+
+# Fixed stabilisation sleeps of vw_mode (s)
+PVSIM_SLEEP_TIME = 60.
+GRIDSIM_SLEEP_TIME = 120.
+
+# Curves of vw_mode in the order they are tested (param name, curve)
+VW_CURVES = [('vw.test_AA', 'AA'), ('vw.test_AB', 'AB'), ('vw.test_AC', 'AC'), ('vw.test_NZ', 'NZ'),
+             ('vw.test_AR', 5)]
+
+# Overheads (s) added to the nominal durations (equipment commands, logging, etc.)
+DEFAULT_OVERHEADS = {'test': 0., 'curve': 0., 'step': 0.}
+
+
+class SuiteError(Exception):
+    pass
+
+
+class TestConfig(object):
+    """
+    Test configuration (.tst) with the parameters merged from the script defaults, the test and the suites
+    """
+    def __init__(self, name, script, params, filename=None, suites=None, test_params=None, suite_files=None):
+        self.name = name
+        self.script = script
+        self.params = params
+        self.filename = filename
+        self.suites = suites if suites is not None else []
+        # parameters of the .tst file and suite files the test belongs to
+        self.test_params = test_params if test_params is not None else collections.OrderedDict()
+        self.suite_files = suite_files if suite_files is not None else []
+
+    def __repr__(self):
+        return 'TestConfig(%s, %s)' % (self.name, self.script)
+
+
+class OfflineScript(object):
+    """
+    Minimal test script object (param_value and logging) used to build the pAus4777 objects offline
+    """
+    def __init__(self, params, version=pAus4777.VERSION):
+        self.params = params
+        self.messages = []
+        self.errors = []
+        self.info = collections.namedtuple('Info', 'version')(version)
+
+    def param_value(self, name):
+        return self.params.get(name)
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def log_debug(self, message):
+        self.messages.append(message)
+
+    def log_error(self, message):
+        self.errors.append(message)
+
+    def log_warning(self, message):
+        self.messages.append(message)
+
+
+def read_params(element):
+    params = collections.OrderedDict()
+    for e in element.findall('params/param'):
+        vtype = param_types.get(e.attrib.get('type'), str)
+        text = e.text if e.text is not None else ''
+        try:
+            params[e.attrib.get('name')] = vtype(text)
+        except ValueError:
+            params[e.attrib.get('name')] = text
+    return params
+
+
+class ScriptDeclarations(object):
+    """
+    Parameters declared by a script without importing it: info.param() defaults, info.param_group() groups
+    and the equipment groups declared by the drivers (e.g. der.params(info))
+    """
+    def __init__(self, script_file):
+        self.defaults = collections.OrderedDict()
+        self.groups = []
+        self.equipment = []
+        with open(script_file) as f:
+            tree = ast.parse(f.read(), filename=script_file)
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and isinstance(node.func.value, ast.Name) and node.args):
+                continue
+            if node.func.value.id == 'info' and node.func.attr in ('param', 'param_group'):
+                try:
+                    name = ast.literal_eval(node.args[0])
+                    default = None
+                    for keyword in node.keywords:
+                        if keyword.arg == 'default':
+                            default = ast.literal_eval(keyword.value)
+                except ValueError:
+                    continue
+                if node.func.attr == 'param':
+                    self.defaults[name] = default
+                else:
+                    self.groups.append(name)
+            elif node.func.attr == 'params' and isinstance(node.args[0], ast.Name) and node.args[0].id == 'info':
+                self.equipment.append(node.func.value.id)
+
+    def is_known(self, name):
+        """
+        False for a parameter of a script group which is not declared by the script (e.g. vv.mode in a VW test)
+        """
+        group = name.split('.')[0]
+        if group in self.equipment:
+            return True
+        return name in self.defaults
+
+
+_declarations = {}
+
+
+def script_declarations(script_file):
+    key = (script_file, os.path.getmtime(script_file))
+    if key not in _declarations:
+        _declarations[key] = ScriptDeclarations(script_file)
+    return _declarations[key]
+
+
+def script_defaults(script_file):
+    """
+    Returns the default values of the info.param() declarations of a script without importing it
+    """
+    return script_declarations(script_file).defaults
+
+
+def find_root(filename):
+    """
+    Returns the SVP directory (containing Suites, Tests and Scripts) of a suite or test file
+    """
+    return os.path.dirname(os.path.dirname(os.path.abspath(filename)))
+
+
+def expand(filename, root=None, suite_params=None, suites=None, suite_files=None):
+    """
+    Expands a suite (recursively) or a test into its test configurations
+    :param filename:        .ste or .tst file
+    :param root:            SVP directory (default: parent directory of the file directory)
+    :param suite_params:    global parameters of the parent suites
+    :return:                list of TestConfig in execution order
+    """
+    if root is None:
+        root = find_root(filename)
+    if suite_params is None:
+        suite_params = collections.OrderedDict()
+    if suites is None:
+        suites = []
+    if suite_files is None:
+        suite_files = []
+    element = ET.ElementTree(file=filename).getroot()
+    name = element.attrib.get('name')
+    ext = os.path.splitext(filename)[1]
+
+    if ext == SUITE_EXT:
+        params = collections.OrderedDict()
+        if element.attrib.get('globals') == 'True':
+            params.update(read_params(element))
+        # globals of the outer suites take precedence
+        params.update(suite_params)
+        tests = []
+        for member in element.findall('members/member'):
+            member_name = member.attrib.get('name')
+            if os.path.splitext(member_name)[1] == SUITE_EXT:
+                member_file = os.path.join(root, 'Suites', member_name)
+            else:
+                member_file = os.path.join(root, 'Tests', member_name)
+            if not os.path.exists(member_file):
+                raise SuiteError('Suite %s member not found: %s' % (name, member_file))
+            tests += expand(member_file, root=root, suite_params=params, suites=suites + [name],
+                            suite_files=suite_files + [filename])
+        return tests
+
+    elif ext == TEST_EXT:
+        script = element.attrib.get('script')
+        script_file = os.path.join(root, 'Scripts', script + '.py')
+        params = collections.OrderedDict()
+        if os.path.exists(script_file):
+            params.update(script_defaults(script_file))
+        test_params = read_params(element)
+        params.update(test_params)
+        params.update(suite_params)
+        return [TestConfig(name, script, params, filename=filename, suites=suites, test_params=test_params,
+                           suite_files=suite_files)]
+
+    raise SuiteError('Unknown configuration file type: %s' % filename)
+
+
+def active_function(params):
+    """
+    Builds the pAus4777 ActiveFunction object of a VW test configuration
+    """
+    ts = OfflineScript(params)
+    if params.get('vw.mode') == 'Volt-Var':
+        functions = [pAus4777.VW, pAus4777.VV]
+    else:
+        functions = [pAus4777.VW]
+    return pAus4777.ActiveFunction(ts=ts, functions=functions, log_level='Error')
+
+
+def enabled_curves(params):
+    return [curve for name, curve in VW_CURVES if params.get(name) == 'Enabled']
+
+
+def step_plans(test, function=None):
+    """
+    Returns the step plan (v_steps_dict) of each enabled curve as built by vw_mode
+    :return: OrderedDict {curve: v_steps_dict}
+    """
+    params = test.params
+    if function is None:
+        function = active_function(params)
+    mode = params.get('vw.mode')
+    plans = collections.OrderedDict()
+    for curve in enabled_curves(params):
+        function.reset_curve(curve)
+        function.reset_time_settings(tr=[params.get('vw.commencement_time'), params.get('vw.completion_time'),
+                                         params.get('vw.step_time_period')], number_tr=3)
+        if mode == 'Volt-Var':
+            plans[curve] = function.create_vw_dict_steps(mode=mode, secondary_pairs=function.get_params(
+                function=pAus4777.VV, region=curve))
+        else:
+            plans[curve] = function.create_vw_dict_steps(mode=mode)
+    return plans
+
+
+def is_measured_step(step_label):
+    return 'C' not in step_label and 'H' not in step_label
+
+
+"""
+Duration estimation (dry-run)
+"""
+
+def mra_window(f_nom=50.):
+    """
+    Duration (s) of the longest measurement window of the V, P and Q channels (see pAus4777.EutParameters)
+    """
+    return pAus4777.MeasurementWindows(f_nom, {meas: [meas] for meas in ('V', 'P', 'Q')}).duration
+
+
+def measure_overheads(dataset_files, step_time_period, window=0.):
+    """
+    Measures the step overhead from previous datasets: time between the initial values of consecutive steps
+    minus the nominal step duration, which is the step time period plus the measurement window of the
+    initial values (as counted by estimate_test)
+    :param window:  measurement window duration (s), see mra_window()
+    :return: mean overhead per step (s), None if it can not be measured
+    """
+    overheads = []
+    for filename in dataset_files:
+        try:
+            df = pd.read_csv(filename, usecols=['TIME', 'EVENT'])
+        except (ValueError, IOError):
+            continue
+        init = df[df['EVENT'].astype(str).str.endswith('_INIT')].drop_duplicates(subset='EVENT')
+        durations = np.diff(init['TIME'].to_numpy(dtype=float))
+        overheads += list(durations - step_time_period - window)
+    if not overheads:
+        return None
+    return float(np.mean(overheads))
+
+
+def estimate_test(test, overheads=None):
+    """
+    Estimates the duration of a test
+    :return: dictionary with the duration (s) split by component, the number of curves and steps and the errors
+    """
+    if overheads is None:
+        overheads = DEFAULT_OVERHEADS
+    params = test.params
+    estimate = collections.OrderedDict([('test', test.name), ('curves', 0), ('steps', 0), ('stabilisation', 0.),
+                                        ('step_time', 0.), ('overhead', overheads.get('test', 0.)),
+                                        ('total', 0.), ('error', None)])
+    if params.get('pvsim.mode', 'Disabled') != 'Disabled':
+        estimate['stabilisation'] += PVSIM_SLEEP_TIME
+    estimate['stabilisation'] += GRIDSIM_SLEEP_TIME
+    try:
+        function = active_function(params)
+        plans = step_plans(test, function=function)
+        power_levels = pAus4777.parse_power_levels(params.get('vw.power_levels'))
+    except Exception as e:
+        estimate['error'] = '%s: %s' % (type(e).__name__, e)
+        return estimate
+
+    # the initial values and each time response are averaged over the measurement windows
+    step_time = params.get('vw.step_time_period') + function.mra_windows.duration
+    voltage_program = params.get('vw.voltage_program') == 'Enabled'
+    for curve, plan in plans.items():
+        if voltage_program:
+            # the grid simulator holds every step (C and H included) for the times of the program
+            function.reset_time_settings(tr=[params.get('vw.commencement_time'), params.get('vw.completion_time'),
+                                             params.get('vw.step_time_period')], number_tr=3)
+            program_time = function.create_voltage_program(plan).duration
+        # each curve is run at every power level of the sweep
+        for power_level in power_levels:
+            estimate['curves'] += 1
+            estimate['overhead'] += overheads.get('curve', 0.)
+            if voltage_program:
+                estimate['steps'] += len([step_label for step_label in plan if is_measured_step(step_label)])
+                estimate['step_time'] += program_time
+                continue
+            for step_label in plan:
+                if is_measured_step(step_label):
+                    estimate['steps'] += 1
+                    estimate['step_time'] += step_time
+                    estimate['overhead'] += overheads.get('step', 0.)
+    estimate['total'] = estimate['stabilisation'] + estimate['step_time'] + estimate['overhead']
+    return estimate
+
+
+def plan(files, overheads=None, root=None):
+    """
+    :return: DataFrame with the estimate of each test of the suites/tests files
+    """
+    estimates = []
+    for filename in files:
+        for test in expand(filename, root=root):
+            estimate = estimate_test(test, overheads=overheads)
+            estimate['suite'] = '/'.join(test.suites)
+            estimates.append(estimate)
+    return pd.DataFrame(estimates)
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+"""
+Pre-flight validation
+"""
+
+ERROR = 'Error'
+WARNING = 'Warning'
+
+Issue = collections.namedtuple('Issue', 'level test message')
+
+CACHE_FILENAME = '.preflight_cache.json'
+CACHE_VERSION = 1
+
+# EUT voltage parameters (eut.v_nom, eut.v_low...) that a suite global may not change
+EUT_VOLTAGE_PREFIX = 'eut.v_'
+
+# Voltage range of the step plans relative to eut.v_nom
+PLAN_V_MIN = 0.5
+PLAN_V_MAX = 1.5
+
+
+def file_hash(filenames):
+    sha = hashlib.sha1()
+    for filename in filenames:
+        sha.update(filename.encode())
+        with open(filename, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def gridsim_params(params, name):
+    """
+    Values of a parameter of the active grid simulator driver (e.g. gridsim.elgar.v_max for gridsim.mode
+    Elgar704), the parameters of the other drivers are not used
+    """
+    mode = str(params.get('gridsim.mode', 'Disabled')).lower()
+    values = []
+    for param, value in params.items():
+        parts = param.split('.')
+        if len(parts) == 3 and parts[0] == 'gridsim' and parts[2] == name and mode.startswith(parts[1]):
+            values.append(value)
+    return [value for value in values if value is not None]
+
+
+def check_test(test, root):
+    """
+    Checks the parameters and the step plans of a test configuration
+    :return: list of Issue
+    """
+    issues = []
+    params = test.params
+
+    def issue(level, message):
+        issues.append(Issue(level, test.name, message))
+
+    script_file = os.path.join(root, 'Scripts', test.script + '.py')
+    if not os.path.exists(script_file):
+        issue(ERROR, 'script not found: %s' % script_file)
+        return issues
+    declarations = script_declarations(script_file)
+
+    # parameters
+    unknown = [name for name in test.test_params if not declarations.is_known(name)]
+    if unknown:
+        issue(WARNING, 'parameters ignored by script %s: %s' % (test.script, ', '.join(unknown)))
+    # the suites are expected to select the equipment, only the EUT and test parameters are reported
+    for name, value in test.test_params.items():
+        if name.split('.')[0] in declarations.groups and name in params and params[name] != value:
+            # the nominal and limit voltages of the EUT size every step plan of the test
+            if name.startswith(EUT_VOLTAGE_PREFIX):
+                level = ERROR
+            else:
+                level = WARNING
+            issue(level, 'test value %s=%s is replaced by the suite global value %s' % (name, value, params[name]))
+
+    v_nom = params.get('eut.v_nom')
+    v_low = params.get('eut.v_low')
+    v_high = params.get('eut.v_high')
+    if v_nom is None:
+        issue(ERROR, 'eut.v_nom is not set')
+        return issues
+    if v_low is not None and v_high is not None and not v_low < v_nom < v_high:
+        issue(ERROR, 'eut.v_low < eut.v_nom < eut.v_high not respected (%s, %s, %s)' % (v_low, v_nom, v_high))
+    for value in gridsim_params(params, 'v_nom'):
+        if value != v_nom:
+            issue(WARNING, 'grid simulator v_nom=%s differs from eut.v_nom=%s' % (value, v_nom))
+    s_rated = params.get('eut.s_rated')
+    p_rated = params.get('eut.p_rated')
+    p_min = params.get('eut.p_min')
+    if None not in (s_rated, p_rated) and p_rated > s_rated:
+        issue(ERROR, 'eut.p_rated (%s) is larger than eut.s_rated (%s)' % (p_rated, s_rated))
+    if None not in (p_min, p_rated) and p_min > p_rated:
+        issue(ERROR, 'eut.p_min (%s) is larger than eut.p_rated (%s)' % (p_min, p_rated))
+
+    timing = [params.get('vw.commencement_time'), params.get('vw.completion_time'), params.get('vw.step_time_period')]
+    if None in timing:
+        issue(ERROR, 'response times not set: %s' % timing)
+        return issues
+    if not timing[0] < timing[1] <= timing[2]:
+        issue(ERROR, 'commencement < completion <= step time period not respected: %s' % timing)
+
+    try:
+        pAus4777.parse_power_levels(params.get('vw.power_levels'))
+    except pAus4777.pAus4777Error as e:
+        issue(ERROR, str(e))
+
+    # curves and step plans
+    if params.get('vw.test_AR') == 'Enabled':
+        issue(ERROR, 'vw.test_AR is enabled but the Allowed Range curve is not implemented (curve 5)')
+    curves = [curve for curve in enabled_curves(params) if curve != 5]
+    if not curves and params.get('vw.test_AR') != 'Enabled':
+        issue(ERROR, 'no curve enabled')
+    checked = TestConfig(test.name, test.script, collections.OrderedDict(params), filename=test.filename)
+    checked.params['vw.test_AR'] = 'Disabled'
+    try:
+        plans = step_plans(checked)
+    except Exception as e:
+        issue(ERROR, 'step plan error %s: %s' % (type(e).__name__, e))
+        return issues
+    v_max = min([value for value in gridsim_params(params, 'v_max') if value] + [np.inf])
+    for curve, plan in plans.items():
+        voltages = np.array(list(plan.values()), dtype=float)
+        if len(voltages) == 0:
+            issue(ERROR, 'curve %s: empty step plan' % curve)
+            continue
+        if voltages.min() < PLAN_V_MIN * v_nom or voltages.max() > PLAN_V_MAX * v_nom:
+            issue(ERROR, 'curve %s: step voltages %.1f-%.1f V are not consistent with eut.v_nom=%s V' %
+                  (curve, voltages.min(), voltages.max(), v_nom))
+        if voltages.max() > v_max:
+            issue(ERROR, 'curve %s: step voltage %.1f V above the grid simulator maximum %s V' %
+                  (curve, voltages.max(), v_max))
+        if not any(is_measured_step(step_label) for step_label in plan):
+            issue(ERROR, 'curve %s: no measured step' % curve)
+    return issues
+
+
+class PreflightChecker(object):
+    """
+    Validates suites and tests before the equipment is started. The issues of a test are cached with the
+    hash of the test, suite and script files so unchanged configurations are not checked again.
+    """
+    def __init__(self, root=None, cache_file=None, use_cache=True):
+        self.root = root
+        self.use_cache = use_cache
+        self.cache_file = cache_file
+        self.cache = {}
+        self.changed = False
+
+    def _load_cache(self, root):
+        if self.cache_file is None:
+            self.cache_file = os.path.join(root, CACHE_FILENAME)
+        if self.use_cache and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file) as f:
+                    cache = json.load(f)
+                if cache.get('version') == CACHE_VERSION:
+                    self.cache = cache['tests']
+            except ValueError:
+                self.cache = {}
+
+    def _save_cache(self):
+        if self.use_cache and self.changed:
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'tests': self.cache}, f)
+            os.replace(tmp_file, self.cache_file)
+            self.changed = False
+
+    def check(self, files):
+        """
+        :param files:   suite (.ste) and test (.tst) files
+        :return: list of Issue
+        """
+        issues = []
+        for filename in files:
+            root = self.root if self.root is not None else find_root(filename)
+            if not self.cache:
+                self._load_cache(root)
+            try:
+                tests = expand(filename, root=root)
+            except (SuiteError, ET.ParseError, IOError) as e:
+                issues.append(Issue(ERROR, os.path.basename(filename), str(e)))
+                continue
+            for test in tests:
+                script_file = os.path.join(root, 'Scripts', test.script + '.py')
+                # the checks depend on this module and on the library building the step plans
+                sources = [test.filename] + test.suite_files + [os.path.abspath(__file__),
+                                                                os.path.abspath(pAus4777.__file__)]
+                if os.path.exists(script_file):
+                    sources.append(script_file)
+                key = '%s|%s' % ('/'.join(test.suites), file_hash(sources))
+                if key in self.cache:
+                    test_issues = [Issue(*issue) for issue in self.cache[key]]
+                else:
+                    test_issues = check_test(test, root)
+                    self.cache[key] = [list(issue) for issue in test_issues]
+                    self.changed = True
+                issues += test_issues
+        self._save_cache()
+        return issues
+
+
+def find_configs(paths):
+    """
+    Returns the suite files of the directories (or of their Suites directory) and the files given
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            if os.path.isdir(os.path.join(path, 'Suites')):
+                path = os.path.join(path, 'Suites')
+            files += sorted(glob.glob(os.path.join(path, '*' + SUITE_EXT)))
+            files += sorted(glob.glob(os.path.join(path, '*' + TEST_EXT)))
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Offline tools for DR AS/NZS 4777.2 suites and tests')
+    parser.add_argument('--root', default=None, help='SVP directory containing Suites, Tests and Scripts')
+    subparsers = parser.add_subparsers(dest='command')
+    plan_parser = subparsers.add_parser('plan', help='dry-run duration estimate')
+    plan_parser.add_argument('paths', nargs='+', help='suite/test files or directories')
+    plan_parser.add_argument('--overheads', default=None,
+                             help='json file with the overheads in seconds per test, curve and step')
+    plan_parser.add_argument('--history', nargs='*', default=None,
+                             help='previous datasets (VW_*.csv) or result directories used to measure the step '
+                                  'overhead')
+    plan_parser.add_argument('--step-time', dest='step_time', type=float, default=20.,
+                             help='step time period of the previous datasets (s)')
+    plan_parser.add_argument('--f-nom', dest='f_nom', type=float, default=50.,
+                             help='nominal frequency of the previous datasets (Hz)')
+    check_parser = subparsers.add_parser('check', help='pre-flight validation')
+    check_parser.add_argument('paths', nargs='+', help='suite/test files or directories')
+    check_parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='check all the tests')
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        files = find_configs(args.paths)
+        issues = PreflightChecker(root=args.root, use_cache=args.use_cache).check(files)
+        for issue in issues:
+            print('%-7s %s: %s' % (issue.level, issue.test, issue.message))
+        errors = len([issue for issue in issues if issue.level == ERROR])
+        print('%d error(s), %d warning(s)' % (errors, len(issues) - errors))
+        sys.exit(1 if errors else 0)
+
+    elif args.command == 'plan':
+        overheads = dict(DEFAULT_OVERHEADS)
+        if args.overheads is not None:
+            with open(args.overheads) as f:
+                overheads.update(json.load(f))
+        if args.history:
+            datasets = []
+            for path in args.history:
+                if os.path.isdir(path):
+                    datasets += glob.glob(os.path.join(path, '**', 'VW_*.csv'), recursive=True)
+                else:
+                    datasets.append(path)
+            step_overhead = measure_overheads(datasets, args.step_time, window=mra_window(args.f_nom))
+            if step_overhead is not None:
+                print('Measured step overhead: %.2f s' % step_overhead)
+                overheads['step'] = step_overhead
+
+        report = plan(find_configs(args.paths), overheads=overheads, root=args.root)
+        pd.set_option('display.width', 200)
+        pd.set_option('display.max_columns', 20)
+        print(report.to_string(index=False))
+        print()
+        totals = report[['stabilisation', 'step_time', 'overhead', 'total']].sum()
+        for component in ['stabilisation', 'step_time', 'overhead']:
+            share = 100. * totals[component] / totals['total'] if totals['total'] else 0.
+            print('%-14s %s (%.1f %%)' % (component, format_duration(totals[component]), share))
+        print('%-14s %s' % ('total', format_duration(totals['total'])))
+        errors = report[report['error'].notna()]
+        if len(errors) > 0:
+            print()
+            for index, row in errors.iterrows():
+                print('%s: %s' % (row['test'], row['error']))
+
+    else:
+        parser.print_help()
@@ -2,6 +2,7 @@ import os
 import xml.etree.ElementTree as ET
 import csv
 import math
+import numpy as np
 import xlsxwriter
 
 RESULT_TYPE_RESULT = 'result'
@@ -49,6 +50,14 @@ index_hdr = [('File', 30),
 
 XL_COL_WIDTH_DEFAULT = 10
 
+# Version of the sheet data format kept in the workbook cache files
+WB_CACHE_VERSION = 2
+
+# Cell kinds of the sheet data kept in the workbook cache files
+WB_CELL_NUMBER = 0
+WB_CELL_TEXT = 1
+WB_CELL_ABSENT = 2
+
 def xl_col(index):
     return chr(index + 65)
 
@@ -63,11 +72,11 @@ def find_result(results_dir, result_dir):
     r_target = r.find(path)
     return r_target
 
-def result_workbook(file, results_dir, result_dir, index=True, ts=None):
+def result_workbook(file, results_dir, result_dir, index=True, ts=None, cache=True):
     r = find_result(results_dir, result_dir)
     if r is not None:
         r.to_xlsx(filename=os.path.join(results_dir, result_dir, file), results_dir=results_dir, index=index,
-                  index_row=0, ts=ts)
+                  index_row=0, ts=ts, cache=cache)
     else:
         raise ResultError('Error creating summary workbook - resource not found: %s %s' % (results_dir, result_dir))
 
@@ -223,11 +232,11 @@ class Result(object):
         else:
             print(xml)
 
-    def to_xlsx(self, wb=None, filename=None, results_dir=None, index=True, index_row=0, ts=None):
+    def to_xlsx(self, wb=None, filename=None, results_dir=None, index=True, index_row=0, ts=None, cache=True):
         print('to_xlsx: %s %s' % (wb, filename))
         result_wb = wb
         if result_wb is None:
-            result_wb = ResultWorkbook(filename=filename, ts=self.ts)
+            result_wb = ResultWorkbook(filename=filename, ts=self.ts, cache=cache)
             if index:
                 result_wb.add_index()
                 index_row = 1
@@ -250,9 +259,10 @@ class Result(object):
 
 class ResultWorkbook(object):
 
-    def __init__(self, filename, ts=None):
+    def __init__(self, filename, ts=None, cache=True):
         self.wb = xlsxwriter.Workbook(filename)
         self.ts = ts
+        self.cache = cache
         self.ws_index = None
         self.hdr_format = self.wb.add_format()
         self.link_format = self.wb.add_format({'color': 'blue', 'underline': 1})
@@ -428,21 +438,64 @@ class ResultWorkbook(object):
 
     def add_csv_file(self, filename, title, relative_value_names=None, params=None, index_row=None):
         print('add_csv_file: %s' % (title))
-        col_width = []
-        line = 1
         # if the excel sheet name is greater than 31 char it can't be added to excel. Truncate it here.
         if len(title) > 31:
             title = title[:31]
         ws = self.wb.add_worksheet(title)
         if index_row is not None:
             index_row = self.add_index_entry(title, index_row)
-        f = None
-        relative_value_index = []
-        relative_value_start = []
         if relative_value_names is None:
             relative_value_names = []
         if params is None:
             params = {}
+        try:
+            sheet = None
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache_key(filename, relative_value_names, params)
+                sheet = self.cache_read(filename, cache_key)
+            if sheet is None:
+                sheet = self.read_csv_file(filename, relative_value_names)
+                if self.cache:
+                    self.cache_write(filename, cache_key, sheet)
+            else:
+                print('add_csv_file: %s unchanged, using cached sheet data' % (filename))
+
+            for i, width in sorted(sheet['col_width'].items()):
+                ws.set_column(i, i, width)
+            for line, row in enumerate(sheet['rows']):
+                ws.write_row(line, 0, row)
+            params['plot.point_names'] = sheet['point_names']
+            params['plot.point_value_count'] = sheet['point_value_count']
+
+            if title[-4:] == '.csv':
+                chart_title = title[:-4]
+            else:
+                chart_title = title + '_chart'
+
+            print('params - plot: %s - %s' % (params, params.get('plot.title')))
+            if params is not None and params.get('plot.title') is not None:
+                index_row = self.add_chart(ws, params=params, index_row=index_row)
+
+        except Exception as e:
+            print('add_csv_file error: %s' % (str(e)))
+            raise
+
+        return index_row
+
+    def read_csv_file(self, filename, relative_value_names):
+        """
+        Reads a csv dataset and returns the sheet data (rows, column widths, point names and point count)
+        """
+        col_width = []
+        # last width set for each column
+        sheet_col_width = {}
+        rows = []
+        point_names = []
+        line = 1
+        f = None
+        relative_value_index = []
+        relative_value_start = []
         try:
             f = open(filename)
             '''
@@ -473,15 +526,15 @@ class ResultWorkbook(object):
                         curr_width = 0
                     if width > curr_width:
                         col_width.insert(i, width)
-                        ws.set_column(i, i, width)
+                        sheet_col_width[i] = width
                 # find fields to be treated as relative value
                 if line == 1:
-                    params['plot.point_names'] = row
+                    point_names = row
                     for i in range(len(row)):
                         width = len(row[i]) + 4
                         if width < XL_COL_WIDTH_DEFAULT:
                             width = XL_COL_WIDTH_DEFAULT
-                        ws.set_column(i, i, width)
+                        sheet_col_width[i] = width
                     if relative_value_names is not None:
                         for name in relative_value_names:
                             try:
@@ -497,27 +550,83 @@ class ResultWorkbook(object):
                 else:
                     for index in relative_value_index:
                         row[index] = row[index] - relative_value_start[index]
-                ws.write_row(line - 1, 0, row)
+                rows.append(row)
                 line += 1
-            params['plot.point_value_count'] = line - 1
-
-            if title[-4:] == '.csv':
-                chart_title = title[:-4]
-            else:
-                chart_title = title + '_chart'
-
-            print('params - plot: %s - %s' % (params, params.get('plot.title')))
-            if params is not None and params.get('plot.title') is not None:
-                index_row = self.add_chart(ws, params=params, index_row=index_row)
-
-        except Exception as e:
-            print('add_csv_file error: %s' % (str(e)))
-            raise
         finally:
             if f:
                 f.close()
 
-        return index_row
+        return {'rows': rows, 'col_width': sheet_col_width, 'point_names': point_names,
+                'point_value_count': line - 1}
+
+    """
+    Sheet data cache: the data read from a dataset is kept beside the dataset (numpy .npz format, no pickled
+    objects) and reused while the dataset size, modification time and the chart parameters are unchanged
+    """
+
+    @staticmethod
+    def cache_filename(filename):
+        path, name = os.path.split(filename)
+        return os.path.join(path, '.%s.wbcache' % name)
+
+    @staticmethod
+    def cache_key(filename, relative_value_names, params):
+        # the dataset is identified by its size and modification time, its content is not read
+        st = os.stat(filename)
+        chart_params = sorted((k, str(v)) for k, v in params.items()
+                              if k not in ('plot.point_names', 'plot.point_value_count'))
+        return repr((WB_CACHE_VERSION, st.st_size, st.st_mtime_ns, relative_value_names, chart_params))
+
+    def cache_read(self, filename, key):
+        try:
+            with np.load(self.cache_filename(filename), allow_pickle=False) as cached:
+                if str(cached['key']) != key:
+                    return None
+                kind = cached['kind']
+                values = cached['values'].tolist()
+                text = cached['text'].tolist()
+                rows = []
+                for i, row_kind in enumerate(kind.tolist()):
+                    row = []
+                    for j, k in enumerate(row_kind):
+                        if k == WB_CELL_NUMBER:
+                            row.append(values[i][j])
+                        elif k == WB_CELL_TEXT:
+                            row.append(text[i][j])
+                    rows.append(row)
+                return {'rows': rows,
+                        'col_width': dict(zip(cached['width_cols'].tolist(), cached['widths'].tolist())),
+                        'point_names': cached['point_names'].tolist(),
+                        'point_value_count': int(cached['point_value_count'])}
+        except Exception:
+            pass
+        return None
+
+    def cache_write(self, filename, key, sheet):
+        rows = sheet['rows']
+        n_cols = max([len(row) for row in rows] + [0])
+        kind = np.full((len(rows), n_cols), WB_CELL_ABSENT, dtype=np.int8)
+        values = np.zeros((len(rows), n_cols))
+        text = [[''] * n_cols for row in rows]
+        for i, row in enumerate(rows):
+            for j, cell in enumerate(row):
+                if isinstance(cell, (int, float)):
+                    kind[i, j] = WB_CELL_NUMBER
+                    values[i, j] = cell
+                else:
+                    kind[i, j] = WB_CELL_TEXT
+                    text[i][j] = str(cell)
+        col_width = sorted(sheet['col_width'].items())
+        try:
+            with open(self.cache_filename(filename), 'wb') as f:
+                np.savez_compressed(f, key=np.array(key), kind=kind, values=values,
+                         text=np.array(text, dtype=str).reshape(len(rows), n_cols),
+                         width_cols=np.array([i for i, w in col_width], dtype=np.int64),
+                         widths=np.array([w for i, w in col_width], dtype=np.int64),
+                         point_names=np.array(sheet['point_names'], dtype=str),
+                         point_value_count=np.array(sheet['point_value_count']))
+        except Exception as e:
+            print('Workbook cache not written for %s: %s' % (filename, str(e)))
 
     def save(self, filename=None):
         pass
@@ -0,0 +1,386 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+import re
+import sys
+import json
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+
+from svpelab.result_pyramid import PYRAMID_EXT, event_segments
+
+ARCHIVE_EXT = '.npz'
+ARCHIVE_VERSION = 1
+INDEX_MEMBER = 'index'
+SUMMARY_FILENAME = 'result_summary.csv'
+DATASET_PATTERN = re.compile(r'^VW_.*\.csv$')
+
+TIME = 'TIME'
+EVENT = 'EVENT'
+STEP = 'STEP'
+
+# TIME is stored as int64 deltas with this resolution (s)
+TIME_RESOLUTION = 1e-6
+
+# column encodings
+FLOAT = 'float'
+DICT = 'dict'
+DELTA = 'delta'
+
+# files regenerated from the datasets (workbooks and their sheet caches), they are not archived
+SKIPPED_EXTS = ('.xlsx', '.wbcache', ARCHIVE_EXT)
+
+# EVENT suffixes written by DataLogging during a step (Step_D_1_INIT, Step_D_1_T_COM_10S, Step_D_1_ABORTED...)
+EVENT_SUFFIX = re.compile(r'_(INIT|T_COM(_\d+S?)?|ABORTED)$')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def step_label(event):
+    return EVENT_SUFFIX.sub('', str(event))
+
+
+def encode_time(time_):
+    """
+    :return: encoding and array, int64 deltas of the time quantized to TIME_RESOLUTION (the first value is
+             absolute), float64 values if the time is not finite
+    """
+    time_ = np.asarray(time_, dtype=float)
+    if not np.isfinite(time_).all():
+        return FLOAT, time_
+    ticks = np.round(time_ / TIME_RESOLUTION).astype(np.int64)
+    return DELTA, np.diff(ticks, prepend=np.int64(0))
+
+
+def decode_time(encoding, values):
+    if encoding == DELTA:
+        return np.cumsum(values) * TIME_RESOLUTION
+    return np.asarray(values, dtype=float)
+
+
+def encode_column(values):
+    """
+    :return: encoding, array and dictionary (None for numeric columns) of a column
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return FLOAT, values.to_numpy(dtype=float), None
+    codes, dictionary = pd.factorize(values.astype(str).where(values.notna()), sort=False)
+    dtype = np.int16 if len(dictionary) < 2 ** 15 else np.int32
+    return DICT, codes.astype(dtype), [str(value) for value in dictionary]
+
+
+def decode_column(encoding, values, dictionary=None):
+    if encoding == DICT:
+        # -1 codes are missing values
+        return np.array(dictionary + [None], dtype=object)[values]
+    return np.asarray(values)
+
+
+def read_summary(filename):
+    """
+    Reads a result summary file. The header is repeated in the file each time a test is appended to it.
+    """
+    df = pd.read_csv(filename, dtype=str, skipinitialspace=True)
+    df.columns = [c.strip() for c in df.columns]
+    if STEP in df.columns:
+        df = df[df[STEP] != STEP]
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        numeric = pd.to_numeric(df[col], errors='coerce')
+        if numeric.notna().sum() == df[col].notna().sum():
+            df[col] = numeric
+    return df
+
+
+class ArchiveWriter(object):
+    """
+    Writes the members of an archive one at a time in a deflated zip (.npz), so the arrays of a single
+    dataset only are in memory
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.zip = zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def write(self, name, array):
+        with self.zip.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def close(self):
+        self.zip.close()
+
+
+def pack_table(writer, prefix, df, segments=None):
+    """
+    Writes the columns of a table, split in segments of rows (members <prefix>/<segment>/<column>)
+    :return: index entry of the table
+    """
+    columns = {}
+    dictionaries = {}
+    encoded = {}
+    for col in df.columns:
+        if col == TIME:
+            columns[col], encoded[col] = encode_time(df[col])
+        else:
+            columns[col], encoded[col], dictionary = encode_column(df[col])
+            if dictionary is not None:
+                dictionaries[col] = dictionary
+    if segments is None:
+        segments = [{'start': 0, 'end': len(df) - 1}]
+    for i, segment in enumerate(segments):
+        for col, values in encoded.items():
+            values = values[segment['start']:segment['end'] + 1]
+            if col == TIME and columns[col] == DELTA and len(values) > 0:
+                # each segment starts with an absolute time so it is decoded alone
+                values = values.copy()
+                values[0] = np.round(df[TIME].iat[segment['start']] / TIME_RESOLUTION)
+            writer.write('%s/%d/%s' % (prefix, i, col), values)
+    return {'rows': len(df), 'columns': columns, 'dictionaries': dictionaries}
+
+
+def pack(root, filename):
+    """
+    Packs the result tree in one archive: the datasets split by step, the result summaries and the other
+    result files (.rlt, logs...). The workbooks and pyramids are not archived as they are rebuilt from the
+    datasets.
+    :return: archive index
+    """
+    index = {'version': ARCHIVE_VERSION, 'time_resolution': TIME_RESOLUTION, 'tests': {}}
+    writer = ArchiveWriter(filename)
+    try:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.endswith(PYRAMID_EXT))
+            filenames = sorted(f for f in filenames if not f.endswith(SKIPPED_EXTS))
+            if not filenames:
+                continue
+            test = os.path.relpath(dirpath, root).replace(os.sep, '/')
+            prefix = 'T%d' % len(index['tests'])
+            entry = {'member': prefix, 'datasets': {}, 'summary': None, 'files': {}}
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if DATASET_PATTERN.match(name):
+                    df = pd.read_csv(path)
+                    if TIME not in df.columns:
+                        raise ArchiveError('Dataset without %s column: %s' % (TIME, path))
+                    member = '%s/D%d' % (prefix, len(entry['datasets']))
+                    steps = []
+                    if EVENT in df.columns:
+                        labels = df[EVENT].astype(str).map(step_label)
+                        steps = event_segments(df[TIME].to_numpy(dtype=float), labels)
+                    table = pack_table(writer, member, df, steps or None)
+                    for step in steps:
+                        step['step'] = step.pop('event')
+                    table.update({'member': member, 'steps': steps})
+                    entry['datasets'][os.path.splitext(name)[0]] = table
+                elif name == SUMMARY_FILENAME:
+                    member = '%s/S' % prefix
+                    entry['summary'] = pack_table(writer, member, read_summary(path))
+                    entry['summary']['member'] = member
+                else:
+                    member = '%s/F%d' % (prefix, len(entry['files']))
+                    with open(path, 'rb') as f:
+                        writer.write(member, np.frombuffer(f.read(), dtype=np.uint8))
+                    entry['files'][name] = member
+            index['tests'][test] = entry
+        writer.write(INDEX_MEMBER, np.frombuffer(json.dumps(index).encode(), dtype=np.uint8))
+    finally:
+        writer.close()
+    return index
+
+
+def verify(root, filename):
+    """
+    Reads back every archived dataset and compares it with its CSV file: the values of each column and the
+    step labels, which are the EVENT labels without their DataLogging suffix (_INIT, _T_COM_10S...)
+    :return: list of the differences found (empty if the archive matches the result tree)
+    """
+    errors = []
+    archive = ResultArchive(filename)
+    try:
+        for test, entry in archive.tests.items():
+            for dataset, table in entry['datasets'].items():
+                path = os.path.join(root, *(test.split('/') + [dataset + '.csv']))
+                df = pd.read_csv(path)
+                if EVENT in df.columns:
+                    # independent of EVENT_SUFFIX: anything after the first DataLogging suffix is dropped
+                    labels = df[EVENT].astype(str).str.replace(r'_(INIT|T_COM|ABORTED).*$', '', regex=True)
+                    labels = [str(s['event']) for s in event_segments(df[TIME].to_numpy(dtype=float), labels)]
+                    if archive.steps(test, dataset) != labels:
+                        errors.append('%s/%s: steps %s instead of %s' % (
+                            test, dataset, archive.steps(test, dataset), labels))
+                        continue
+                for col in df.columns:
+                    values = archive.read(test, dataset, col)
+                    if col == TIME:
+                        same = np.allclose(values, df[col].to_numpy(dtype=float), rtol=0.,
+                                           atol=TIME_RESOLUTION, equal_nan=True)
+                    elif table['columns'][col] == FLOAT:
+                        same = np.array_equal(values, df[col].to_numpy(dtype=float), equal_nan=True)
+                    else:
+                        expected = df[col].astype(str).where(df[col].notna())
+                        same = list(values) == [None if pd.isna(v) else v for v in expected]
+                    if not same:
+                        errors.append('%s/%s: column %s differs' % (test, dataset, col))
+    finally:
+        archive.close()
+    return errors
+
+
+class ResultArchive(object):
+    """
+    Reads an archive written by pack(). The members are decompressed on access only, reading a channel of a
+    step decompresses that channel of that step.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.npz = np.load(filename, allow_pickle=False)
+        if INDEX_MEMBER not in self.npz.files:
+            raise ArchiveError('Archive index not found: %s' % filename)
+        self.index = json.loads(self.npz[INDEX_MEMBER].tobytes().decode())
+        if self.index.get('version') != ARCHIVE_VERSION:
+            raise ArchiveError('Unsupported archive version in %s' % filename)
+        self.tests = self.index['tests']
+
+    def _test(self, test):
+        if test not in self.tests:
+            raise ArchiveError('Test %s not in the archive' % test)
+        return self.tests[test]
+
+    def _dataset(self, test, dataset):
+        datasets = self._test(test)['datasets']
+        if dataset not in datasets:
+            raise ArchiveError('Dataset %s not in test %s' % (dataset, test))
+        return datasets[dataset]
+
+    def steps(self, test, dataset):
+        return [step['step'] for step in self._dataset(test, dataset)['steps']]
+
+    def _column(self, table, segment, col):
+        if col not in table['columns']:
+            raise ArchiveError('Column %s not in the archive' % col)
+        values = self.npz['%s/%d/%s' % (table['member'], segment, col)]
+        encoding = table['columns'][col]
+        if col == TIME:
+            return decode_time(encoding, values)
+        return decode_column(encoding, values, table['dictionaries'].get(col))
+
+    def read(self, test, dataset, channel, step=None):
+        """
+        :param test:    test directory relative to the archived root
+        :param dataset: dataset name (e.g. VW_AA)
+        :param channel: column (e.g. AC_P_1, TIME, EVENT)
+        :param step:    step label (e.g. Step_D_1), all the steps if None
+        :return: array of the channel values
+        """
+        table = self._dataset(test, dataset)
+        if table['steps']:
+            segments = [i for i, s in enumerate(table['steps']) if step is None or s['step'] == step]
+        else:
+            segments = [0] if step is None else []
+        if not segments:
+            raise ArchiveError('Step %s not in dataset %s' % (step, dataset))
+        return np.concatenate([self._column(table, i, channel) for i in segments])
+
+    def read_step(self, test, dataset, step=None, channels=None):
+        """
+        :return: DataFrame of the channels (all by default) of a step
+        """
+        table = self._dataset(test, dataset)
+        if channels is None:
+            channels = list(table['columns'])
+        return pd.DataFrame({c: self.read(test, dataset, c, step) for c in channels})
+
+    def read_summary(self, test):
+        table = self._test(test)['summary']
+        if table is None:
+            raise ArchiveError('No result summary in test %s' % test)
+        return pd.DataFrame({c: self._column(table, 0, c) for c in table['columns']})
+
+    def read_file(self, test, name):
+        files = self._test(test)['files']
+        if name not in files:
+            raise ArchiveError('File %s not in test %s' % (name, test))
+        return self.npz[files[name]].tobytes()
+
+    def close(self):
+        self.npz.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Compressed columnar archive of result directories')
+    subparsers = parser.add_subparsers(dest='command')
+    pack_parser = subparsers.add_parser('pack', help='pack a result directory')
+    pack_parser.add_argument('root', help='result directory')
+    pack_parser.add_argument('archive', nargs='?', default=None, help='archive file (default: <root>.npz)')
+    pack_parser.add_argument('--verify', action='store_true', help='read back the datasets after packing')
+    list_parser = subparsers.add_parser('list', help='list the tests, datasets and steps of an archive')
+    list_parser.add_argument('archive', help='archive file')
+    read_parser = subparsers.add_parser('read', help='read channels of a dataset or of a step')
+    read_parser.add_argument('archive', help='archive file')
+    read_parser.add_argument('test', help='test directory relative to the archived root')
+    read_parser.add_argument('dataset', help='dataset name (e.g. VW_AA)')
+    read_parser.add_argument('channels', nargs='*', help='channel labels (default: all)')
+    read_parser.add_argument('--step', default=None, help='step label (e.g. Step_D_1)')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        archive_file = args.archive
+        if archive_file is None:
+            archive_file = os.path.normpath(args.root) + ARCHIVE_EXT
+        index = pack(args.root, archive_file)
+        print('%s: %d tests, %d bytes' % (archive_file, len(index['tests']), os.path.getsize(archive_file)))
+        if args.verify:
+            errors = verify(args.root, archive_file)
+            for error in errors:
+                print(error)
+            if errors:
+                sys.exit(1)
+    elif args.command == 'list':
+        archive = ResultArchive(args.archive)
+        for test, entry in archive.tests.items():
+            print(test)
+            for name, table in entry['datasets'].items():
+                print('  %s: %d rows, %s' % (name, table['rows'], ', '.join(s['step'] for s in table['steps'])))
+            for name in entry['files']:
+                print('  %s' % name)
+        archive.close()
+    elif args.command == 'read':
+        archive = ResultArchive(args.archive)
+        result = archive.read_step(args.test, args.dataset, args.step, args.channels or None)
+        result.to_csv(sys.stdout, index=False)
+        archive.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,189 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+import sys
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+
+KEY_COLS = ['STEP', 'FILENAME']
+SUMMARY_FILENAME = 'result_summary.csv'
+
+PASS = 'Pass'
+FAIL = 'Fail'
+# completion criteria of the step at which a fail-fast curve was aborted, they have no verdict
+ABORTED = 'Aborted'
+
+
+class ResultCompareError(Exception):
+    pass
+
+
+def find_summaries(paths):
+    """
+    Returns the result summary files of a list of files or result directories (searched recursively)
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '**', SUMMARY_FILENAME), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+
+def load_summary(filename):
+    """
+    Loads a result summary file. The header is repeated in the file each time a test is appended to it.
+    """
+    df = pd.read_csv(filename, dtype=str, skipinitialspace=True)
+    df.columns = [c.strip() for c in df.columns]
+    for col in KEY_COLS:
+        if col not in df.columns:
+            raise ResultCompareError('Column %s missing in %s' % (col, filename))
+    df = df[df['STEP'] != 'STEP']
+    # the last row of a step is kept if the step has been repeated
+    return df.drop_duplicates(subset=KEY_COLS, keep='last').set_index(KEY_COLS)
+
+
+class SummaryComparison(object):
+    """
+    Aligns many result summaries on (STEP, FILENAME) and compares them to a baseline run.
+    The values are kept in arrays shaped (runs, steps, columns) so the deltas, the margins to the
+    pass/fail bounds and the pass/fail flips are computed for all the runs at once.
+    """
+    def __init__(self, files, baseline=0):
+        self.files = files
+        self.baseline = baseline
+        summaries = [load_summary(f) for f in files]
+        self.keys = summaries[0].index
+        for summary in summaries[1:]:
+            self.keys = self.keys.union(summary.index)
+        columns = []
+        for summary in summaries:
+            columns += [c for c in summary.columns if c not in columns]
+        aligned = [summary.reindex(index=self.keys, columns=columns) for summary in summaries]
+
+        # pass/fail columns contain only Pass, Fail or Aborted
+        self.pf_cols = [c for c in columns
+                        if set(pd.concat([a[c] for a in aligned]).dropna().unique()) <= {PASS, FAIL, ABORTED}
+                        and any(a[c].isin([PASS, FAIL]).any() for a in aligned)]
+        self.num_cols = [c for c in columns if c not in self.pf_cols]
+        self.values = np.stack([a[self.num_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+                                for a in aligned])
+        pf = np.stack([a[self.pf_cols].to_numpy(dtype=object) for a in aligned])
+        # an aborted criterion is compared with nothing, like a missing step
+        self.pf_valid = pd.notna(pf) & (pf != ABORTED)
+        self.pf_pass = pf == PASS
+
+    def col(self, name):
+        return self.values[:, :, self.num_cols.index(name)]
+
+    def deltas(self, names=('P_MEAS', 'Q_MEAS')):
+        """
+        :return: {column: array (runs, steps)} of the differences with the baseline run
+        """
+        return {name: self.col(name) - self.col(name)[self.baseline]
+                for name in names if name in self.num_cols}
+
+    def margins(self):
+        """
+        :return: {y: array (runs, steps)} distance of the measured value to the closest pass/fail bound,
+                 negative when the value is outside the bounds
+        """
+        margins = {}
+        for name in self.num_cols:
+            if name.endswith('_TARGET_MIN'):
+                y = name[:-len('_TARGET_MIN')]
+                if f'{y}_MEAS' in self.num_cols and f'{y}_TARGET_MAX' in self.num_cols:
+                    meas = self.col(f'{y}_MEAS')
+                    margins[y] = np.minimum(meas - self.col(f'{y}_TARGET_MIN'), self.col(f'{y}_TARGET_MAX') - meas)
+        return margins
+
+    def flips(self):
+        """
+        :return: boolean array (runs, steps, pass/fail columns) True where the result differs from the baseline
+        """
+        valid = self.pf_valid & self.pf_valid[self.baseline]
+        return valid & (self.pf_pass != self.pf_pass[self.baseline])
+
+    def report(self):
+        """
+        :return: DataFrame with one row per run and step, ranked by number of pass/fail flips, smallest margin
+                 and largest delta
+        """
+        n_runs, n_steps = self.values.shape[:2]
+        report = pd.DataFrame({
+            'RUN': np.repeat(self.files, n_steps),
+            'STEP': np.tile(self.keys.get_level_values('STEP'), n_runs),
+            'FILENAME': np.tile(self.keys.get_level_values('FILENAME'), n_runs)})
+        flips = self.flips()
+        report['FLIPS'] = flips.sum(axis=2).ravel()
+        report['FLIPPED'] = [','.join(np.array(self.pf_cols)[f]) for f in flips.reshape(-1, len(self.pf_cols))]
+        report['FAILS'] = (self.pf_valid & ~self.pf_pass).sum(axis=2).ravel()
+        for name, delta in self.deltas().items():
+            report[f'{name}_DELTA'] = delta.ravel()
+        margins = self.margins()
+        for y, margin in margins.items():
+            report[f'{y}_MARGIN'] = margin.ravel()
+        if margins:
+            report['MIN_MARGIN'] = np.nanmin(np.stack([m.ravel() for m in margins.values()]), axis=0)
+        else:
+            report['MIN_MARGIN'] = np.nan
+        delta_cols = [c for c in report.columns if c.endswith('_DELTA')]
+        report['MAX_ABS_DELTA'] = report[delta_cols].abs().max(axis=1) if delta_cols else np.nan
+        # the baseline run is not compared with itself
+        report = report[report['RUN'] != self.files[self.baseline]]
+        return report.sort_values(['FLIPS', 'MIN_MARGIN', 'MAX_ABS_DELTA'],
+                                  ascending=[False, True, False]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Compare result summaries with a baseline run')
+    parser.add_argument('baseline', help='baseline result summary file or result directory')
+    parser.add_argument('runs', nargs='+', help='result summary files or result directories to compare')
+    parser.add_argument('--top', type=int, default=None, help='number of steps in the report')
+    parser.add_argument('--output', default=None, help='csv file for the report (default: stdout)')
+    args = parser.parse_args()
+
+    files = find_summaries([args.baseline]) + find_summaries(args.runs)
+    if len(files) < 2:
+        sys.exit('At least two result summaries are needed')
+    report = SummaryComparison(files, baseline=0).report()
+    if args.top is not None:
+        report = report.head(args.top)
+    if args.output is not None:
+        report.to_csv(args.output, index=False)
+    else:
+        report.to_csv(sys.stdout, index=False)
@@ -0,0 +1,212 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+import re
+import sys
+import csv
+import sqlite3
+import argparse
+from datetime import datetime
+
+SUMMARY_TABLE = 'summary'
+
+# Columns added to the result summary columns (get_rslt_sum_col_name) to index the rows
+COL_RUN = 'RUN'
+COL_CURVE = 'CURVE'
+COL_FUNCTION = 'FUNCTION'
+COL_PASS_FAIL = 'PASS_FAIL'
+COL_TIMESTAMP = 'TIMESTAMP'
+COL_STEP = 'STEP'
+COL_FILENAME = 'FILENAME'
+
+INDEXED_COLS = [COL_RUN, COL_CURVE, COL_STEP, COL_FUNCTION, COL_PASS_FAIL]
+
+# Result summary columns stored as REAL (measurements, targets and Monte Carlo flip probabilities), the
+# other columns are TEXT
+NUMERIC_COL = re.compile(r'_(MEAS|TARGET(_MIN|_MAX)?|FLIP_RCT_\w+)$')
+
+PASS = 'Pass'
+FAIL = 'Fail'
+# step at which a fail-fast curve was aborted (its completion criteria are not evaluated)
+ABORTED = 'Aborted'
+
+
+class ResultDbError(Exception):
+    pass
+
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def col_type(name):
+    if NUMERIC_COL.search(name):
+        return 'REAL'
+    return 'TEXT'
+
+
+def to_real(value):
+    """
+    :return: float value of a result summary field, None (NULL) for the missing values (e.g. 'None')
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultSummaryDb(object):
+    """
+    Results sink writing the result summary rows (same columns as result_summary.csv) in a local SQLite
+    database shared by all the runs. The rows of a curve are written in a single transaction.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.columns = []
+        self.rows = []
+        self.run = None
+        self.curve = None
+        self.function = None
+        self._create()
+
+    def _create(self):
+        fixed_cols = [COL_RUN, COL_CURVE, COL_FUNCTION, COL_PASS_FAIL, COL_TIMESTAMP, COL_STEP, COL_FILENAME]
+        self.conn.execute('CREATE TABLE IF NOT EXISTS %s (%s)' %
+                          (SUMMARY_TABLE, ', '.join('%s TEXT' % quote(col) for col in fixed_cols)))
+        for col in INDEXED_COLS:
+            self.conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' %
+                              (quote('idx_%s' % col.lower()), SUMMARY_TABLE, quote(col)))
+        self.conn.commit()
+        self.columns = self._table_columns()
+
+    def _table_columns(self):
+        return [row[1] for row in self.conn.execute('PRAGMA table_info(%s)' % SUMMARY_TABLE)]
+
+    def _add_columns(self, col_names):
+        for col in col_names:
+            if col not in self.columns:
+                self.conn.execute('ALTER TABLE %s ADD COLUMN %s %s' % (SUMMARY_TABLE, quote(col), col_type(col)))
+                self.columns.append(col)
+
+    def begin_curve(self, run, curve, function):
+        """
+        :param run:         run identifier (e.g. results directory and test name)
+        :param curve:       characteristic curve (e.g. AA, NZ)
+        :param function:    function(s) tested (e.g. VW, VW_VV)
+        """
+        if self.rows:
+            self.commit()
+        self.run = run
+        self.curve = curve
+        self.function = function
+
+    def write(self, col_names, row):
+        """
+        Queues a result summary row
+        :param col_names:   header string from get_rslt_sum_col_name()
+        :param row:         row string from write_rslt_sum()
+        """
+        names = col_names.strip().split(',')
+        values = row.strip().split(',')
+        if len(names) != len(values):
+            raise ResultDbError('Result summary row does not match the column names: %s' % row)
+        record = dict((name, to_real(value) if col_type(name) == 'REAL' else value)
+                      for name, value in zip(names, values))
+        if FAIL in values:
+            pass_fail = FAIL
+        elif ABORTED in values:
+            pass_fail = ABORTED
+        else:
+            pass_fail = PASS
+        record.update({COL_RUN: self.run, COL_CURVE: self.curve, COL_FUNCTION: self.function,
+                       COL_PASS_FAIL: pass_fail, COL_TIMESTAMP: datetime.now().isoformat()})
+        self.rows.append(record)
+
+    def commit(self):
+        """
+        Writes the queued rows in one transaction
+        """
+        if not self.rows:
+            return
+        with self.conn:
+            for record in self.rows:
+                self._add_columns(record.keys())
+            for cols in set(tuple(record.keys()) for record in self.rows):
+                records = [record for record in self.rows if tuple(record.keys()) == cols]
+                self.conn.executemany('INSERT INTO %s (%s) VALUES (%s)' %
+                                      (SUMMARY_TABLE, ', '.join(quote(col) for col in cols),
+                                       ', '.join('?' for col in cols)),
+                                      [tuple(record[col] for col in cols) for record in records])
+        self.rows = []
+
+    def query(self, run=None, curve=None, step=None, function=None, pass_fail=None):
+        """
+        :return: column names and rows matching all the given criteria
+        """
+        criteria = [(COL_RUN, run), (COL_CURVE, curve), (COL_STEP, step), (COL_FUNCTION, function),
+                    (COL_PASS_FAIL, pass_fail)]
+        where = [(col, value) for col, value in criteria if value is not None]
+        sql = 'SELECT * FROM %s' % SUMMARY_TABLE
+        if where:
+            sql += ' WHERE ' + ' AND '.join('%s = ?' % quote(col) for col, value in where)
+        sql += ' ORDER BY %s, rowid' % quote(COL_TIMESTAMP)
+        cursor = self.conn.execute(sql, [value for col, value in where])
+        return [d[0] for d in cursor.description], cursor.fetchall()
+
+    def close(self):
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Query the result summary database')
+    parser.add_argument('database', help='SQLite result summary database')
+    parser.add_argument('--run', help='run identifier')
+    parser.add_argument('--curve', help='characteristic curve (e.g. AA, AB, AC, NZ)')
+    parser.add_argument('--step', help='step label (e.g. Step_D_1)')
+    parser.add_argument('--function', help='function (e.g. VW, VW_VV)')
+    parser.add_argument('--pass-fail', dest='pass_fail', choices=[PASS, FAIL, ABORTED], help='overall step result')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        sys.exit('Database not found: %s' % args.database)
+    db = ResultSummaryDb(args.database)
+    names, rows = db.query(run=args.run, curve=args.curve, step=args.step, function=args.function,
+                           pass_fail=args.pass_fail)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(names)
+    writer.writerows(rows)
+    db.close()
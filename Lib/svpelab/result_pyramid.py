@@ -0,0 +1,274 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+PYRAMID_EXT = '.pyramid'
+INDEX_FILENAME = 'index.json'
+PYRAMID_VERSION = 1
+
+TIME = 'TIME'
+EVENT = 'EVENT'
+
+# statistics kept for each bucket of the reduced levels
+STATS = ['min', 'max', 'mean']
+
+
+class PyramidError(Exception):
+    pass
+
+
+def pyramid_path(dataset_file):
+    """
+    Returns the pyramid directory of a dataset (VW_AA.csv -> VW_AA.pyramid)
+    """
+    return os.path.splitext(dataset_file)[0] + PYRAMID_EXT
+
+
+def event_segments(time_, events):
+    """
+    Contiguous runs of the same EVENT value
+    :return: list of dictionaries with the event, the first and last rows and the time range
+    """
+    events = np.asarray(events).astype(str)
+    if len(events) == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, events[1:] != events[:-1]])
+    ends = np.r_[starts[1:], len(events)] - 1
+    return [{'event': events[s], 'start': int(s), 'end': int(e), 't_start': float(time_[s]),
+             't_end': float(time_[e])} for s, e in zip(starts, ends)]
+
+
+def _reduce(values, counts, factor, stat):
+    """
+    Reduces a level by the factor (the last bucket is padded)
+    """
+    n = len(values)
+    size = -(-n // factor) * factor
+    if stat == 'mean':
+        # weighted by the number of raw samples in each bucket
+        weighted = np.zeros(size)
+        weighted[:n] = np.nan_to_num(values) * counts
+        valid = np.zeros(size)
+        valid[:n] = np.where(np.isnan(values), 0, counts)
+        total = valid.reshape(-1, factor).sum(axis=1)
+        return np.divide(weighted.reshape(-1, factor).sum(axis=1), total,
+                         out=np.full(len(total), np.nan), where=total > 0)
+    padded = np.full(size, np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(-1, factor)
+    # buckets with only NaN values stay NaN
+    empty = np.isnan(blocks).all(axis=1)
+    blocks = np.where(np.isnan(blocks), np.inf if stat == 'min' else -np.inf, blocks)
+    result = blocks.min(axis=1) if stat == 'min' else blocks.max(axis=1)
+    result[empty] = np.nan
+    return result
+
+
+class DatasetPyramid(object):
+    """
+    Multi-resolution min/max/mean pyramid of the channels of a dataset stored beside it as a directory of
+    .npy arrays (memory mapped when read). Level 0 holds the raw samples, each level above reduces the
+    previous one by the factor. A time range is extracted from the finest level with at most max_points
+    buckets, so the cost does not depend on the length of the capture.
+    """
+    def __init__(self, path):
+        self.path = path
+        index_file = os.path.join(path, INDEX_FILENAME)
+        if not os.path.exists(index_file):
+            raise PyramidError('Pyramid index not found: %s' % index_file)
+        with open(index_file) as f:
+            self.index = json.load(f)
+        if self.index.get('version') != PYRAMID_VERSION:
+            raise PyramidError('Unsupported pyramid version in %s' % path)
+        self.channels = self.index['channels']
+        self.segments = self.index['segments']
+        self.levels = self.index['levels']
+        self.arrays = {}
+
+    @staticmethod
+    def build(dataset, path=None, factor=8, min_size=256):
+        """
+        :param dataset:     dataset csv file or DataFrame
+        :param path:        pyramid directory (default: beside the dataset file)
+        :param factor:      number of buckets of a level reduced in one bucket of the next level
+        :param min_size:    the coarsest level has at most min_size buckets
+        """
+        if isinstance(dataset, pd.DataFrame):
+            df = dataset
+            if path is None:
+                raise PyramidError('The pyramid path is needed to build from a DataFrame')
+        else:
+            df = pd.read_csv(dataset)
+            if path is None:
+                path = pyramid_path(dataset)
+        if TIME not in df.columns:
+            raise PyramidError('Dataset without %s column' % TIME)
+        os.makedirs(path, exist_ok=True)
+
+        time_ = df[TIME].to_numpy(dtype=float)
+        channels = [c for c in df.columns if c not in (TIME, EVENT) and pd.api.types.is_numeric_dtype(df[c])]
+        segments = event_segments(time_, df[EVENT]) if EVENT in df.columns else []
+
+        levels = []
+        level = 0
+        t_min, t_max = time_, time_
+        counts = np.ones(len(time_))
+        values = {c: df[c].to_numpy(dtype=float) for c in channels}
+        while True:
+            np.save(os.path.join(path, 'L%d_time_min.npy' % level), t_min)
+            np.save(os.path.join(path, 'L%d_time_max.npy' % level), t_max)
+            if level == 0:
+                for c in channels:
+                    np.save(os.path.join(path, 'L0_%s.npy' % c), values[c])
+            else:
+                for c in channels:
+                    for stat in STATS:
+                        np.save(os.path.join(path, 'L%d_%s_%s.npy' % (level, c, stat)), values[c][stat])
+            levels.append({'level': level, 'size': len(t_min), 'bucket': factor ** level})
+            if len(t_min) <= min_size:
+                break
+            if level == 0:
+                values = {c: {stat: _reduce(v, counts, factor, stat) for stat in STATS} for c, v in values.items()}
+            else:
+                values = {c: {stat: _reduce(v[stat], counts, factor, stat) for stat in STATS}
+                          for c, v in values.items()}
+            t_min = _reduce(t_min, counts, factor, 'min')
+            t_max = _reduce(t_max, counts, factor, 'max')
+            counts = np.add.reduceat(counts, np.arange(0, len(counts), factor))
+            level += 1
+
+        index = {'version': PYRAMID_VERSION, 'factor': factor, 'rows': len(time_), 'channels': channels,
+                 'segments': segments, 'levels': levels}
+        with open(os.path.join(path, INDEX_FILENAME), 'w') as f:
+            json.dump(index, f, indent=1)
+        return DatasetPyramid(path)
+
+    def _array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self.arrays[name]
+
+    def get_segment(self, event):
+        """
+        :return: the first segment of the event (e.g. 'Step_D_1'), None if the event is not in the dataset
+        """
+        for segment in self.segments:
+            if segment['event'] == event:
+                return segment
+        return None
+
+    def extract(self, channels, t_start=None, t_end=None, max_points=2000):
+        """
+        :param channels:    channel label or list of labels
+        :param t_start:     start of the time range (default: start of the dataset)
+        :param t_end:       end of the time range (default: end of the dataset)
+        :param max_points:  maximum number of buckets returned
+        :return: DataFrame with the bucket time range (TIME_MIN, TIME_MAX) and the min, max and mean of the
+                 channels (<channel>_MIN, <channel>_MAX, <channel>_MEAN), and the level used
+        """
+        if isinstance(channels, str):
+            channels = [channels]
+        for c in channels:
+            if c not in self.channels:
+                raise PyramidError('Channel %s not in the pyramid' % c)
+        for level in self.levels:
+            time_min = self._array('L%d_time_min' % level['level'])
+            time_max = self._array('L%d_time_max' % level['level'])
+            lo = 0 if t_start is None else int(np.searchsorted(time_max, t_start, side='left'))
+            hi = len(time_min) if t_end is None else int(np.searchsorted(time_min, t_end, side='right'))
+            if hi - lo <= max_points or level is self.levels[-1]:
+                break
+        n = level['level']
+        data = {'TIME_MIN': np.array(time_min[lo:hi]), 'TIME_MAX': np.array(time_max[lo:hi])}
+        for c in channels:
+            if n == 0:
+                raw = np.array(self._array('L0_%s' % c)[lo:hi])
+                data.update({'%s_MIN' % c: raw, '%s_MAX' % c: raw, '%s_MEAN' % c: raw})
+            else:
+                for stat in STATS:
+                    data['%s_%s' % (c, stat.upper())] = np.array(self._array('L%d_%s_%s' % (n, c, stat))[lo:hi])
+        result = pd.DataFrame(data)
+        result.attrs['level'] = n
+        return result
+
+    def extract_segment(self, event, channels, max_points=2000):
+        segment = self.get_segment(event)
+        if segment is None:
+            raise PyramidError('Event %s not in the dataset' % event)
+        return self.extract(channels, segment['t_start'], segment['t_end'], max_points=max_points)
+
+
+def find_datasets(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '**', 'VW_*.csv'), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Multi-resolution pyramids of the test datasets')
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser('build', help='build the pyramids beside the datasets')
+    build_parser.add_argument('datasets', nargs='+', help='dataset csv files or result directories')
+    build_parser.add_argument('--factor', type=int, default=8, help='reduction factor between levels')
+    extract_parser = subparsers.add_parser('extract', help='extract a time range or a step of a dataset')
+    extract_parser.add_argument('dataset', help='dataset csv file')
+    extract_parser.add_argument('channels', nargs='+', help='channel labels (e.g. AC_P_1)')
+    extract_parser.add_argument('--event', default=None, help='step event (e.g. Step_D_1)')
+    extract_parser.add_argument('--start', type=float, default=None, help='start time (s)')
+    extract_parser.add_argument('--end', type=float, default=None, help='end time (s)')
+    extract_parser.add_argument('--points', type=int, default=2000, help='maximum number of points')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for dataset_file in find_datasets(args.datasets):
+            pyramid = DatasetPyramid.build(dataset_file, factor=args.factor)
+            print('%s: %d levels' % (pyramid.path, len(pyramid.levels)))
+    elif args.command == 'extract':
+        pyramid = DatasetPyramid(pyramid_path(args.dataset))
+        if args.event is not None:
+            result = pyramid.extract_segment(args.event, args.channels, max_points=args.points)
+        else:
+            result = pyramid.extract(args.channels, args.start, args.end, max_points=args.points)
+        result.to_csv(sys.stdout, index=False)
+    else:
+        parser.print_help()
@@ -0,0 +1,126 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from svpelab import pAus4777
+
+# Australia A curves of a 10 kVA EUT at 230 V and the tolerances of DataLogging.get_envelope (1.5 x MRA)
+VW_CURVE = ([253., 260.], [8000., 1600.])
+VV_CURVE = ([207., 220., 240., 258.], [4400., 0., 0., -6000.])
+V_TOL = 1.5 * 0.01 * 230.
+P_TOL = 1.5 * 0.04 * 10000.
+
+
+def baseline_bounds(v, x, y, pwr):
+    """
+    Pass/fail bounds computed sample by sample by update_target_value() and calculate_min_max_values()
+    before the envelope tables
+    """
+    target_min = [round(float(np.interp(value + V_TOL, x, y)) * pwr, 1) - P_TOL for value in v]
+    target_max = [round(float(np.interp(value - V_TOL, x, y)) * pwr, 1) + P_TOL for value in v]
+    return np.array(target_min), np.array(target_max)
+
+
+def test_envelope_table_bounds():
+    v = np.random.default_rng(4777).uniform(200., 270., 5000)
+    for x, y in (VW_CURVE, VV_CURVE):
+        # around the points of the curve and at the ends of the table
+        v_test = np.concatenate([v, x, np.array(x) - V_TOL, np.array(x) + V_TOL, [150., 300.]])
+        for pwr in (1.0, 0.5, 0.2):
+            envelope = pAus4777.EnvelopeTable(x, y, pwr=pwr, v_tol=V_TOL, y_tol=P_TOL)
+            target_min, target_max = envelope.get_bounds(v_test)
+            expected_min, expected_max = baseline_bounds(v_test, x, y, pwr)
+            # the rounding to 0.1 may differ by one digit on the float noise of the interpolation
+            assert np.allclose(target_min, expected_min, rtol=0., atol=0.1 + 1e-6)
+            assert np.allclose(target_max, expected_max, rtol=0., atol=0.1 + 1e-6)
+            targets = envelope.get_target(v_test)
+            assert np.allclose(targets, [round(float(np.interp(value, x, y)) * pwr, 1) for value in v_test],
+                               rtol=0., atol=0.1 + 1e-6)
+
+
+def test_envelope_table_scalar():
+    x, y = VW_CURVE
+    envelope = pAus4777.EnvelopeTable(x, y, pwr=1.0, v_tol=V_TOL, y_tol=P_TOL)
+    target_min, target_max = envelope.get_bounds(256.)
+    assert isinstance(target_min, float) and isinstance(target_max, float)
+    expected_min, expected_max = baseline_bounds([256.], x, y, 1.0)
+    assert abs(target_min - expected_min[0]) <= 0.1 + 1e-6
+    assert abs(target_max - expected_max[0]) <= 0.1 + 1e-6
+    assert envelope.get_target(200.) == 8000.
+
+
+def test_progress_journal_resume(tmp_path):
+    filename = str(tmp_path / 'VW_AusA_progress.json')
+    params = {'vw.test_AA': 'Enabled', 'eut.v_nom': 230., 'vw.power_levels': '1.0'}
+    journal = pAus4777.ProgressJournal(filename, params=params)
+    journal.step_completed('VW_AA', 'Step_C')
+    journal.step_completed('VW_AA', 'Step_D_1', 'row_1\n')
+    dataset = str(tmp_path / 'VW_AA.csv')
+    ds = pd.DataFrame({'TIME': [0., 0.5, 1.], 'AC_P_1': [1., 2., 3.]})
+    journal.save_dataset('VW_AA', ds, dataset)
+
+    # interrupted run resumed with the same parameters
+    journal = pAus4777.ProgressJournal(filename, params=dict(params))
+    assert not journal.discarded
+    assert journal.get_completed('VW_AA') == ['Step_C', 'Step_D_1']
+    assert journal.is_completed('VW_AA', 'Step_D_1')
+    assert not journal.is_completed('VW_AA', 'Step_D_2')
+    assert not journal.is_curve_done('VW_AA')
+    assert journal.get_rows() == ['row_1\n']
+
+    # the new capture continues the previous dataset one sample period after its end
+    journal.step_completed('VW_AA', 'Step_D_2', 'row_2\n')
+    ds = pd.DataFrame({'TIME': [0., 0.5], 'AC_P_1': [4., 5.]})
+    journal.save_dataset('VW_AA', ds, dataset)
+    journal.curve_completed('VW_AA')
+    df = pd.read_csv(dataset)
+    assert df['TIME'].tolist() == [0., 0.5, 1., 1.5, 2.]
+    assert df['AC_P_1'].tolist() == [1., 2., 3., 4., 5.]
+
+    journal = pAus4777.ProgressJournal(filename, params=params)
+    assert journal.is_curve_done('VW_AA')
+    assert journal.get_rows() == ['row_1\n', 'row_2\n']
+    journal.clear()
+    assert not (tmp_path / 'VW_AusA_progress.json').exists()
+
+
+def test_progress_journal_other_params(tmp_path):
+    filename = str(tmp_path / 'VW_AusA_progress.json')
+    journal = pAus4777.ProgressJournal(filename, params={'eut.v_nom': 230.})
+    journal.step_completed('VW_AA', 'Step_D_1', 'row_1\n')
+
+    # a journal written with other parameters is not resumed
+    journal = pAus4777.ProgressJournal(filename, params={'eut.v_nom': 240.})
+    assert journal.discarded
+    assert journal.get_completed('VW_AA') == []
+    assert journal.get_rows() == []
@@ -0,0 +1,139 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from svpelab import result_archive
+from svpelab import result_pyramid
+
+STEPS = ['Step_C', 'Step_D_1', 'Step_D_2']
+
+
+def make_dataset(rows_per_step=400):
+    """
+    Dataset like DataLogging writes it: the EVENT of each step starts with its initial values (_INIT) followed
+    by its time response (_T_COM_<n>S)
+    """
+    n = rows_per_step * len(STEPS)
+    events = []
+    for step in STEPS:
+        events += [f'{step}_INIT'] * (rows_per_step // 4) + [f'{step}_T_COM_10S'] * (rows_per_step - rows_per_step // 4)
+    time_ = np.arange(n) * 0.01
+    p = np.sin(time_) * 4000. + 4000.
+    return pd.DataFrame({'TIME': time_, 'AC_VRMS_1': np.round(230. + time_, 3), 'AC_P_1': p, 'EVENT': events})
+
+
+def make_results(root):
+    test_dir = os.path.join(root, 'VW_AusA')
+    os.makedirs(test_dir)
+    make_dataset().to_csv(os.path.join(test_dir, 'VW_AA.csv'), index=False)
+    with open(os.path.join(test_dir, 'result_summary.csv'), 'w') as f:
+        f.write('P_T_COM_2_PF,P_MEAS,STEP,FILENAME\n')
+        f.write('Pass,4000.5,Step_D_1,VW_AA.csv\n')
+        f.write('Fail,3000.25,Step_D_2,VW_AA.csv\n')
+    with open(os.path.join(test_dir, 'VW_AusA.log'), 'wb') as f:
+        f.write(b'log line\n')
+    return test_dir
+
+
+def test_archive_round_trip(tmp_path):
+    root = str(tmp_path / 'results')
+    test_dir = make_results(root)
+    filename = str(tmp_path / 'results.npz')
+    index = result_archive.pack(root, filename)
+    assert list(index['tests']) == ['VW_AusA']
+    assert result_archive.verify(root, filename) == []
+
+    df = pd.read_csv(os.path.join(test_dir, 'VW_AA.csv'))
+    archive = result_archive.ResultArchive(filename)
+    try:
+        assert archive.steps('VW_AusA', 'VW_AA') == STEPS
+        assert np.allclose(archive.read('VW_AusA', 'VW_AA', 'TIME'), df['TIME'], rtol=0.,
+                           atol=result_archive.TIME_RESOLUTION)
+        assert np.array_equal(archive.read('VW_AusA', 'VW_AA', 'AC_P_1'), df['AC_P_1'])
+        step = archive.read_step('VW_AusA', 'VW_AA', step='Step_D_1')
+        expected = df[df['EVENT'].str.startswith('Step_D_1_')].reset_index(drop=True)
+        assert list(step['EVENT']) == list(expected['EVENT'])
+        assert np.array_equal(step['AC_VRMS_1'], expected['AC_VRMS_1'])
+
+        summary = archive.read_summary('VW_AusA')
+        assert list(summary['STEP']) == ['Step_D_1', 'Step_D_2']
+        assert list(summary['P_MEAS']) == [4000.5, 3000.25]
+        assert archive.read_file('VW_AusA', 'VW_AusA.log') == b'log line\n'
+    finally:
+        archive.close()
+
+
+def test_archive_verify_differences(tmp_path):
+    root = str(tmp_path / 'results')
+    test_dir = make_results(root)
+    filename = str(tmp_path / 'results.npz')
+    result_archive.pack(root, filename)
+    df = pd.read_csv(os.path.join(test_dir, 'VW_AA.csv'))
+    df.loc[10, 'AC_P_1'] += 1.
+    df.to_csv(os.path.join(test_dir, 'VW_AA.csv'), index=False)
+    assert result_archive.verify(root, filename) == ['VW_AusA/VW_AA: column AC_P_1 differs']
+
+
+def test_pyramid_extract(tmp_path):
+    df = make_dataset(rows_per_step=4000)
+    dataset = str(tmp_path / 'VW_AA.csv')
+    df.to_csv(dataset, index=False)
+    df = pd.read_csv(dataset)
+    pyramid = result_pyramid.DatasetPyramid.build(dataset, factor=8, min_size=256)
+    assert pyramid.path == result_pyramid.pyramid_path(dataset)
+    assert pyramid.channels == ['AC_VRMS_1', 'AC_P_1']
+
+    # the whole capture from a reduced level, the buckets bound the raw samples
+    extract = pyramid.extract('AC_P_1', max_points=500)
+    assert extract.attrs['level'] > 0
+    assert len(extract) <= 500
+    assert np.isclose(extract['AC_P_1_MIN'].min(), df['AC_P_1'].min())
+    assert np.isclose(extract['AC_P_1_MAX'].max(), df['AC_P_1'].max())
+    assert (extract['AC_P_1_MIN'] <= extract['AC_P_1_MEAN'] + 1e-9).all()
+    assert (extract['AC_P_1_MEAN'] <= extract['AC_P_1_MAX'] + 1e-9).all()
+
+    # a short time range comes from the raw samples
+    extract = pyramid.extract(['AC_P_1', 'AC_VRMS_1'], t_start=10., t_end=12.)
+    assert extract.attrs['level'] == 0
+    raw = df[(df['TIME'] >= 10.) & (df['TIME'] <= 12.)]
+    assert np.allclose(extract['TIME_MIN'], raw['TIME'])
+    assert np.array_equal(extract['AC_VRMS_1_MEAN'], raw['AC_VRMS_1'])
+
+    # the segment of an event
+    segment = pyramid.get_segment('Step_D_1_T_COM_10S')
+    extract = pyramid.extract_segment('Step_D_1_T_COM_10S', 'AC_P_1', max_points=100000)
+    raw = df[df['EVENT'] == 'Step_D_1_T_COM_10S']
+    assert segment['t_start'] == raw['TIME'].iloc[0]
+    assert np.array_equal(extract['AC_P_1_MEAN'], raw['AC_P_1'])
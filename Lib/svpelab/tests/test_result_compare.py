@@ -0,0 +1,96 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import numpy as np
+
+from svpelab import result_compare
+
+HEADER = 'P_T_COM_2_PF,P_FINAL_PF,P_MEAS,P_TARGET_MIN,P_TARGET_MAX,STEP,FILENAME\n'
+
+
+def write_summary(path, rows):
+    with open(str(path), 'w') as f:
+        f.write(HEADER)
+        for row in rows:
+            f.write(row + '\n')
+    return str(path)
+
+
+def test_flips(tmp_path):
+    baseline = write_summary(tmp_path / 'baseline.csv', [
+        'Pass,Pass,4000.,3900.,4100.,Step_D_1,VW_AA.csv',
+        'Pass,Pass,3000.,2900.,3100.,Step_D_2,VW_AA.csv',
+        'Fail,Pass,2000.,1900.,2100.,Step_D_3,VW_AA.csv'])
+    run = write_summary(tmp_path / 'run.csv', [
+        'Pass,Pass,4010.,3900.,4100.,Step_D_1,VW_AA.csv',
+        'Pass,Fail,3200.,2900.,3100.,Step_D_2,VW_AA.csv',
+        'Pass,Pass,2000.,1900.,2100.,Step_D_3,VW_AA.csv'])
+    comparison = result_compare.SummaryComparison([baseline, run])
+    assert comparison.pf_cols == ['P_T_COM_2_PF', 'P_FINAL_PF']
+    flips = comparison.flips()
+    assert not flips[0].any()
+    # (steps, pass/fail columns) of the run
+    assert flips[1].tolist() == [[False, False], [False, True], [True, False]]
+    assert np.allclose(comparison.deltas()['P_MEAS'][1], [10., 200., 0.])
+    # the measured value is outside the bounds by 100
+    assert comparison.margins()['P'][1][1] == -100.
+
+    report = comparison.report()
+    assert len(report) == 3
+    assert report['FLIPS'].tolist() == [1, 1, 0]
+    assert report['STEP'].iloc[-1] == 'Step_D_1'
+
+
+def test_aborted_criteria(tmp_path):
+    baseline = write_summary(tmp_path / 'baseline.csv', [
+        'Pass,Pass,4000.,3900.,4100.,Step_D_1,VW_AA.csv',
+        'Pass,Pass,3000.,2900.,3100.,Step_D_2,VW_AA.csv'])
+    run = write_summary(tmp_path / 'run.csv', [
+        'Fail,Pass,4500.,3900.,4100.,Step_D_1,VW_AA.csv',
+        'Aborted,Aborted,3000.,2900.,3100.,Step_D_2,VW_AA.csv'])
+    comparison = result_compare.SummaryComparison([baseline, run])
+    # the aborted values do not turn the pass/fail columns into numeric columns
+    assert comparison.pf_cols == ['P_T_COM_2_PF', 'P_FINAL_PF']
+    flips = comparison.flips()
+    assert flips[1].tolist() == [[True, False], [False, False]]
+    # an aborted criterion is neither a pass nor a fail
+    assert not comparison.pf_valid[1][1].any()
+    assert comparison.report()['FAILS'].tolist() == [1, 0]
+
+
+def test_missing_step(tmp_path):
+    baseline = write_summary(tmp_path / 'baseline.csv', [
+        'Pass,Pass,4000.,3900.,4100.,Step_D_1,VW_AA.csv',
+        'Pass,Pass,3000.,2900.,3100.,Step_D_2,VW_AA.csv'])
+    run = write_summary(tmp_path / 'run.csv', [
+        'Fail,Fail,4500.,3900.,4100.,Step_D_2,VW_AA.csv'])
+    comparison = result_compare.SummaryComparison([baseline, run])
+    assert comparison.flips()[1].tolist() == [[False, False], [True, True]]
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2018, CSIRO, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of CSIRO and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+
+import pytest
+
+from svpelab import result_db
+
+COL_NAMES = 'P_TR_ACC_REQ,P_FINAL_ACC_REQ,V_MEAS,P_MEAS,P_TARGET,STEP,FILENAME\n'
+
+
+def test_write_commit_query(tmp_path):
+    db = result_db.ResultSummaryDb(str(tmp_path / 'summary.db'))
+    db.begin_curve(run='run_1', curve='AA', function='VW')
+    db.write(COL_NAMES, 'Pass,Pass,253.1,4000.2,4001.0,Step_D_1,VW_AA.csv\n')
+    db.write(COL_NAMES, 'Pass,Fail,255.0,2000.0,None,Step_D_2,VW_AA.csv\n')
+    db.write(COL_NAMES, 'Aborted,Aborted,256.0,None,None,Step_D_3,VW_AA.csv\n')
+    # the rows are written on commit only
+    assert db.query()[1] == []
+    db.commit()
+
+    cols, rows = db.query(run='run_1', curve='AA')
+    assert len(rows) == 3
+    records = [dict(zip(cols, row)) for row in rows]
+    assert [r[result_db.COL_STEP] for r in records] == ['Step_D_1', 'Step_D_2', 'Step_D_3']
+    assert [r[result_db.COL_PASS_FAIL] for r in records] == [result_db.PASS, result_db.FAIL, result_db.ABORTED]
+    # the measurements are stored as numbers, the missing values as NULL
+    assert records[0]['P_MEAS'] == 4000.2
+    assert records[1]['P_TARGET'] is None
+    assert db.query(pass_fail=result_db.FAIL)[1][0][cols.index(result_db.COL_STEP)] == 'Step_D_2'
+    db.close()
+
+
+def test_rows_kept_across_connections(tmp_path):
+    filename = str(tmp_path / 'summary.db')
+    db = result_db.ResultSummaryDb(filename)
+    db.begin_curve(run='run_1', curve='AA', function='VW')
+    db.write(COL_NAMES, 'Pass,Pass,253.1,4000.2,4001.0,Step_D_1,VW_AA.csv\n')
+    # begin_curve commits the rows of the previous curve
+    db.begin_curve(run='run_1', curve='NZ', function='VW')
+    db.write(COL_NAMES, 'Pass,Pass,253.1,4000.2,4001.0,Step_D_1,VW_NZ.csv\n')
+    db.close()
+
+    db = result_db.ResultSummaryDb(filename)
+    assert len(db.query(run='run_1')[1]) == 2
+    assert len(db.query(curve='NZ')[1]) == 1
+    db.close()
+
+
+def test_row_not_matching_the_columns(tmp_path):
+    db = result_db.ResultSummaryDb(str(tmp_path / 'summary.db'))
+    with pytest.raises(result_db.ResultDbError):
+        db.write(COL_NAMES, 'Pass,Pass,253.1\n')
+    db.close()
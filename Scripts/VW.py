@@ -42,6 +42,8 @@ from svpelab import hil
 from svpelab import pAus4777
 import script
 from svpelab import result as rslt
+from svpelab import result_db
+from svpelab import result_pyramid
 from datetime import datetime, timedelta
 
 import numpy as np
@@ -56,6 +58,27 @@ F = 'F'
 P = 'P'
 Q = 'Q'
 
+# parameters the results depend on, a progress journal written with other values is not resumed
+RESUME_PARAMS = ['vw.mode', 'vw.test_AA', 'vw.test_AB', 'vw.test_AC', 'vw.test_NZ', 'vw.test_AR',
+                 'vw.test_AR_Vw1', 'vw.test_AR_Vw2', 'vw.test_AR_Vv1', 'vw.test_AR_Vv2', 'vw.test_AR_Vv3',
+                 'vw.test_AR_Vv4', 'vw.commencement_time', 'vw.completion_time', 'vw.step_time_period',
+                 'vw.power_levels', 'vw.voltage_program', 'vw.dataset_timing', 'vw.mc_samples',
+                 'vw.mc_distribution', 'eut.phases', 'eut.s_rated',
+                 'eut.p_rated', 'eut.p_min', 'eut.var_rated', 'eut.v_nom', 'eut.v_low', 'eut.v_high',
+                 'eut.v_in_nom', 'eut.f_nom', 'eut.imbalance_resp']
+
+def write_step(result_summary, results_db, journal, curve_key, step_label, col_names, rslt_sum):
+    """
+    Writes the result summary row of a step to the result summary, the result database and the progress journal
+    :param step_label:  label of the completed step, None for a row not completing a step (aborted curve)
+    """
+    result_summary.write(rslt_sum)
+    if results_db is not None:
+        results_db.write(col_names, rslt_sum)
+    if journal is not None and step_label is not None:
+        journal.step_completed(curve_key, step_label, rslt_sum)
+
+
 #Test protocole including VoltWatt and VoltVar
 def vw_mode(vw_curves, mode=None):
 
@@ -68,6 +91,12 @@ def vw_mode(vw_curves, mode=None):
     chil = None
     result_summary = None
     dataset_filename = None
+    results_db = None
+    journal = None
+    curve_key = None
+    logger = None
+    monte_carlo = None
+    acquisition = None
 
     try:
         # Rated powers
@@ -91,20 +120,37 @@ def vw_mode(vw_curves, mode=None):
         phases = ts.param_value('eut.phases')
 
         vw_response_time = 0
+        der_verify = ts.param_value('vw.der_verify') == 'Enabled'
+        dataset_timing = ts.param_value('vw.dataset_timing') == 'Enabled'
         vw_timing = [ts.param_value('vw.commencement_time'),
                      ts.param_value('vw.completion_time'),
                      ts.param_value('vw.step_time_period')]
+        try:
+            power_levels = pAus4777.parse_power_levels(ts.param_value('vw.power_levels'))
+        except pAus4777.pAus4777Error as e:
+            raise script.ScriptFail(str(e))
+        sweep = power_levels != [1.0]
 
         """
         A separate module has been create for the DR_AS_NZS_4777.2 Standard
         """
         pAus4777.VersionValidation(script_version=ts.info.version)
+        log_level = ts.param_value('vw.log_level')
 
         if mode == 'Volt-Var':
             #VoltVar = pAus4777.VoltVar(ts=ts)
-            Active_function = pAus4777.ActiveFunction(ts=ts, functions=[VW, VV])
+            Active_function = pAus4777.ActiveFunction(ts=ts, functions=[VW, VV], log_level=log_level)
         else:
-            Active_function = pAus4777.ActiveFunction(ts=ts, functions=[VW])
+            Active_function = pAus4777.ActiveFunction(ts=ts, functions=[VW], log_level=log_level)
+        logger = Active_function.logger
+        if ts.param_value('vw.log_records') == 'Enabled':
+            logger.open_records(ts.result_file_path(f'{ts.config_name()}_log.jsonl'))
+        mc_samples = ts.param_value('vw.mc_samples')
+        if mc_samples:
+            monte_carlo = pAus4777.MonteCarloMargins(n_samples=mc_samples, workers=ts.param_value('vw.mc_workers'),
+                                                     distribution=ts.param_value('vw.mc_distribution'))
+            Active_function.set_monte_carlo(monte_carlo)
+        Active_function.set_fail_fast(ts.param_value('vw.fail_fast') == 'Enabled')
         #ts.log_debug(f"AUS4777,2 Library configured for {Active_function.script_complete_name}")
         #ts.log_debug(f"AUS4777,2 Library configured for {Active_function.VoltWatt.get_params()}")
 
@@ -145,6 +191,16 @@ def vw_mode(vw_curves, mode=None):
 
         ts.log(f'DAS device: {daq.info()}')
 
+        # fixed-rate background acquisition read by the library instead of on-demand samples
+        acquisition_rate = ts.param_value('vw.acquisition_rate')
+        if acquisition_rate:
+            acquisition = pAus4777.AcquisitionThread(daq, channels=Active_function.get_capture_channels(),
+                                                     rate=acquisition_rate)
+            # the DAQ is shared with the sampling thread, all the accesses are serialized
+            daq = acquisition.daq
+            Active_function.set_sample_source(acquisition)
+            ts.log(f'Background acquisition at {acquisition_rate} Hz')
+
         # Setting the pvsim to the rated power of the eut
         if pv is not None:
             pv.iv_curve_config(pmp=p_pvsim, vmp=v_in_nom)
@@ -162,6 +218,8 @@ def vw_mode(vw_curves, mode=None):
         eut = der.der_init(ts)
         if eut is not None:
             eut.config()
+            # write only the modified settings and serve readbacks from cache
+            eut = pAus4777.DerCache(eut, ts=ts)
             # ts.log_debug(eut.measurements())
 
             #Deactivating all functions on EUT
@@ -178,17 +236,54 @@ def vw_mode(vw_curves, mode=None):
         result_summary = open(ts.result_file_path(result_summary_filename), 'a+')
         ts.result_file(result_summary_filename)
         ts.log(f'col_name={Active_function.get_rslt_sum_col_name()}')
-        result_summary.write(Active_function.get_rslt_sum_col_name())
+
+        # progress journal to resume an interrupted test
+        if ts.param_value('vw.resume') == 'Enabled':
+            journal = pAus4777.ProgressJournal(os.path.join(ts.results_dir(), f'{ts.config_name()}_progress.json'),
+                                               params={name: ts.param_value(name) for name in RESUME_PARAMS})
+            if journal.discarded:
+                ts.log('The progress journal was written with other test parameters, the test starts from the beginning')
+            if result_summary.tell() == 0:
+                result_summary.write(Active_function.get_rslt_sum_col_name())
+                for row in journal.get_rows():
+                    result_summary.write(row)
+        else:
+            result_summary.write(Active_function.get_rslt_sum_col_name())
+
+        # optional result summary database shared by all the runs
+        if ts.param_value('vw.result_db'):
+            results_db = result_db.ResultSummaryDb(ts.param_value('vw.result_db'))
 
         '''
         Repeat the test for each regions curves (Australia A, Australia B, Australia C, New Zealand and Allowed range)
+        and for each power level of the sweep
         '''
         ts.log(f'curves={vw_curves}')
-        for vw_curve in vw_curves:
+        if sweep:
+            ts.log(f'power levels={power_levels}')
+        # step plans of the curves, shared by the power levels
+        v_steps_dicts = {}
+        for vw_curve, pwr_lvl in [(curve, pwr) for curve in vw_curves for pwr in power_levels]:
             #ts.log(f'curves={vw_curve}')
-            ts.log(f'Starting test with characteristic curve {vw_curve}')
+            curve_label = vw_curve
+            if sweep:
+                curve_label = f'{vw_curve}_{pAus4777.power_level_label(pwr_lvl)}'
+            ts.log(f'Starting test with characteristic curve {vw_curve} at {round(pwr_lvl * 100)}% of available power')
             Active_function.reset_curve(vw_curve)
+            Active_function.reset_pwr(pwr_lvl)
             Active_function.reset_time_settings(tr=vw_timing, number_tr=3)
+
+            dataset_filename = f'VW_{curve_label}'
+            if mode == 'Volt-Var':
+                dataset_filename += '_combined_VV'
+            curve_key = dataset_filename
+            if journal is not None and journal.is_curve_done(curve_key):
+                ts.log(f'Curve {curve_label} already completed, skipping')
+                continue
+
+            if results_db is not None:
+                results_db.begin_curve(run=f'{ts.result_dir()}/{ts.config_name()}',
+                                       curve=curve_label, function=f'{VW}_{VV}' if mode == 'Volt-Var' else VW)
             
             if mode == 'Volt-Var':
                 vv_pairs = Active_function.get_params(function=VV, region=vw_curve)
@@ -202,6 +297,7 @@ def vw_mode(vw_curves, mode=None):
             '''
 
             if eut is not None:
+                # the settings unchanged between the power levels of a curve are not written again (DerCache)
                 # Activate volt-var function with following parameters
                 # SunSpec convention is to use percentages for V and Q points.
                 if mode == 'Volt-Var':
@@ -215,7 +311,7 @@ def vw_mode(vw_curves, mode=None):
                     }
                     ts.log_debug(f'Sending Volt-Var points: {vv_curve_params}')
                     eut.volt_var(params={'Ena': True, 'ACTCRV': vw_curve, 'curve': vv_curve_params})
-                    ts.log_debug(f'Initial EUT Volt-Var settings are {eut.volt_var()}')
+                    ts.log_debug(f'Initial EUT Volt-Var settings are {eut.volt_var(verify=der_verify)}')
 
                 # Activate volt-watt function with following parameters
                 # SunSpec convention is to use percentages for V and P points.
@@ -227,7 +323,7 @@ def vw_mode(vw_curves, mode=None):
                 }
                 ts.log_debug(f'Sending Volt-Watt points: {vw_curve_params}')
                 eut.volt_watt(params={'Ena': True, 'ACTCRV': vw_curve, 'curve': vw_curve_params})
-                ts.log_debug(f'Initial EUT Volt-Watt settings are {eut.volt_watt()}')
+                ts.log_debug(f'Initial EUT Volt-Watt settings are {eut.volt_watt(verify=der_verify)}')
             """
              (b) Set the grid source equal to the grid test voltage. Vary the energy source until the a.c. output
                 of the device under test equals 100 ± 5 % of its rated active power output.
@@ -235,9 +331,9 @@ def vw_mode(vw_curves, mode=None):
             # Setting grid to vnom before test
             if grid is not None:
                 grid.voltage(v_nom)
-            # Setting the pvsim to the rated power of the eut
+            # Setting the pvsim to the power level of the eut rated power
             if pv is not None:
-                pv.iv_curve_config(pmp=p_pvsim, vmp=v_in_nom)
+                pv.iv_curve_config(pmp=p_pvsim * pwr_lvl, vmp=v_in_nom)
                 #pv.iv_curve_config(pmp=p_rated, vmp=v_in_nom)
                 pv.irradiance_set(1000.)
 
@@ -246,33 +342,95 @@ def vw_mode(vw_curves, mode=None):
             """
             #Construct the v_steps_dict from step c to step n
 
-            if mode == 'Volt-Var':
-                v_steps_dict = Active_function.create_vw_dict_steps(mode=mode, secondary_pairs=vv_pairs)
-            else:
-                v_steps_dict = Active_function.create_vw_dict_steps(mode=mode)
+            if vw_curve not in v_steps_dicts:
+                if mode == 'Volt-Var':
+                    v_steps_dicts[vw_curve] = Active_function.create_vw_dict_steps(mode=mode, secondary_pairs=vv_pairs)
+                else:
+                    v_steps_dicts[vw_curve] = Active_function.create_vw_dict_steps(mode=mode)
+            v_steps_dict = v_steps_dicts[vw_curve]
             ts.log_debug(v_steps_dict)
 
-            dataset_filename = f'VW_{vw_curve}'
-            if mode == 'Volt-Var':
-                dataset_filename += '_combined_VV'
             Active_function.reset_filename(filename=dataset_filename)
-            # Start the data acquisition systems
-            daq.data_capture(True)
-
-            for step_label, v_step in v_steps_dict.items():
-                ts.log(f'Voltage step: setting Grid simulator voltage to {v_step} ({step_label})')
-                if 'C' in step_label or 'H' in step_label:
-                    if grid is not None:
-                        grid.voltage(v_step)
+            # voltage of the last completed step when resuming
+            v_resume = None
+            resuming = journal is not None and len(journal.get_completed(curve_key)) > 0
+            if resuming:
+                ts.log(f'Resuming curve {curve_label} after {journal.get_completed(curve_key)[-1]}')
+
+            # Voltage steps executed autonomously by the grid simulator
+            program = None
+            if ts.param_value('vw.voltage_program') == 'Enabled':
+                if resuming:
+                    ts.log('Resuming curve, voltage steps sent by the script')
+                elif pAus4777.VoltageProgram.is_supported(grid):
+                    program = Active_function.create_voltage_program(v_steps_dict)
+                    program.arm(grid)
                 else:
-                    Active_function.start(daq=daq, step_label=step_label)
+                    ts.log('Grid simulator does not support voltage programs, voltage steps sent by the script')
 
-                    if grid is not None:
-                        grid.voltage(v_step)
-
-                    Active_function.record_timeresponse(daq=daq, step_value=v_step)
-                    Active_function.evaluate_criterias()
-                    result_summary.write(Active_function.write_rslt_sum())
+            # Start the data acquisition systems
+            daq.data_capture(True)
+            if acquisition is not None:
+                acquisition.start()
+
+            if program is not None:
+                program.trigger(grid)
+                ts.log(f'Voltage program triggered ({program.duration} seconds)')
+
+            aborted_row = None
+            try:
+                for step_label, v_step in v_steps_dict.items():
+                    if program is not None:
+                        if 'C' not in step_label and 'H' not in step_label:
+                            ts.log(f'Voltage step: Grid simulator program at {v_step} ({step_label})')
+                            Active_function.start(daq=daq, step_label=step_label,
+                                                  timestamp=program.get_step_time(step_label))
+                            Active_function.record_timeresponse(daq=daq, step_value=v_step, evaluate=True)
+                            rslt_sum = Active_function.write_rslt_sum()
+                            if dataset_timing:
+                                Active_function.defer_step(v_step, rslt_sum)
+                                continue
+                            write_step(result_summary, results_db, journal, curve_key, step_label,
+                                       Active_function.get_rslt_sum_col_name(), rslt_sum)
+                        continue
+
+                    if journal is not None and journal.is_completed(curve_key, step_label):
+                        v_resume = v_step
+                        continue
+                    if v_resume is not None:
+                        # restore the voltage of the last completed step before measuring the next one
+                        if ('C' not in step_label and 'H' not in step_label) and grid is not None:
+                            ts.log(f'Resuming: setting Grid simulator voltage to {v_resume} for {vw_timing[2]} seconds')
+                            grid.voltage(v_resume)
+                            ts.sleep(vw_timing[2])
+                        v_resume = None
+
+                    ts.log(f'Voltage step: setting Grid simulator voltage to {v_step} ({step_label})')
+                    if 'C' in step_label or 'H' in step_label:
+                        if grid is not None:
+                            grid.voltage(v_step)
+                        if journal is not None:
+                            journal.step_completed(curve_key, step_label)
+                    else:
+                        Active_function.start(daq=daq, step_label=step_label)
+
+                        if grid is not None:
+                            grid.voltage(v_step)
+                        Active_function.step_applied(daq=daq)
+
+                        Active_function.record_timeresponse(daq=daq, step_value=v_step, evaluate=True)
+                        rslt_sum = Active_function.write_rslt_sum()
+                        if dataset_timing:
+                            Active_function.defer_step(v_step, rslt_sum)
+                            continue
+                        write_step(result_summary, results_db, journal, curve_key, step_label,
+                                   Active_function.get_rslt_sum_col_name(), rslt_sum)
+            except pAus4777.CurveAborted as e:
+                ts.log_error(f'Curve {curve_label} aborted at {e.step_label}: {e.reason}')
+                aborted_row = Active_function.write_rslt_sum()
+                if program is not None and datetime.now() < program.get_end_time():
+                    # let the grid simulator program end before the next curve
+                    ts.sleep((program.get_end_time() - datetime.now()).total_seconds())
 
             """
             (o) Summarize results in a table from initial value to final voltage value showing voltage,
@@ -283,14 +441,35 @@ def vw_mode(vw_curves, mode=None):
 
             ts.log('Sampling complete')
             dataset_filename = dataset_filename + ".csv"
+            if acquisition is not None:
+                acquisition.stop()
             daq.data_capture(False)
             ds = daq.data_capture_dataset()
+            # result summary rows resolved at the DAQ timestamps of the dataset
+            for step_label, rslt_sum in Active_function.resolve_steps(ds):
+                write_step(result_summary, results_db, journal, curve_key, step_label,
+                           Active_function.get_rslt_sum_col_name(), rslt_sum)
+            if aborted_row is not None:
+                write_step(result_summary, results_db, journal, curve_key, None,
+                           Active_function.get_rslt_sum_col_name(), aborted_row)
+            if results_db is not None:
+                results_db.commit()
             ts.log(f'Saving file: {dataset_filename}')
-            ds.to_csv(ts.result_file_path(dataset_filename))
+            if journal is not None:
+                journal.save_dataset(curve_key, ds, ts.result_file_path(dataset_filename))
+                journal.curve_completed(curve_key)
+            else:
+                ds.to_csv(ts.result_file_path(dataset_filename))
             result_params['plot.title'] = dataset_filename.split('.csv')[0]
             ts.result_file(dataset_filename, params=result_params)
+            if ts.param_value('vw.dataset_pyramid') == 'Enabled':
+                result_pyramid.DatasetPyramid.build(ts.result_file_path(dataset_filename))
             result = script.RESULT_COMPLETE
 
+        # all the curves are completed, the next run starts from the beginning
+        if journal is not None:
+            journal.clear()
+
     except script.ScriptFail as e:
         reason = str(e)
         if reason:
@@ -299,16 +478,31 @@ def vw_mode(vw_curves, mode=None):
     except Exception as e:
         if dataset_filename is not None:
             dataset_filename = dataset_filename + ".csv"
+            if acquisition is not None:
+                acquisition.stop()
             daq.data_capture(False)
             ds = daq.data_capture_dataset()
+            # steps measured before the exception
+            for step_label, rslt_sum in Active_function.resolve_steps(ds):
+                write_step(result_summary, results_db, journal, curve_key, step_label,
+                           Active_function.get_rslt_sum_col_name(), rslt_sum)
+            # the steps measured before the exception are kept in the database
+            if results_db is not None:
+                results_db.commit()
             ts.log(f'Saving file: {dataset_filename}')
-            ds.to_csv(ts.result_file_path(dataset_filename))
+            if journal is not None and not journal.is_curve_done(curve_key):
+                journal.save_dataset(curve_key, ds, ts.result_file_path(dataset_filename))
+            else:
+                ds.to_csv(ts.result_file_path(dataset_filename))
             result_params['plot.title'] = dataset_filename.split('.csv')[0]
             ts.result_file(dataset_filename, params=result_params)
         ts.log_error(f'Test script exception: {traceback.format_exc()}')
 
 
     finally:
+        if acquisition is not None:
+            acquisition.close()
+            daq = acquisition.device
         if daq is not None:
             daq.close()
         if pv is not None:
@@ -323,6 +517,13 @@ def vw_mode(vw_curves, mode=None):
             eut.close()
         if result_summary is not None:
             result_summary.close()
+        if results_db is not None:
+            results_db.close()
+        if monte_carlo is not None:
+            monte_carlo.close()
+        # the queued library messages are sent before the script exits
+        if logger is not None:
+            logger.close()
 
     return result
 
@@ -418,6 +619,30 @@ info.param('vw.test_AR', label='Allowed Range curve', default='Disabled', values
 info.param('vw.commencement_time', label='Commencement time(s):', default=1.2)
 info.param('vw.completion_time', label='Completion time(s):', default=10.2)
 info.param('vw.step_time_period', label='Step time period(s):', default=20.0)
+info.param('vw.power_levels', label='Power levels swept for each curve (p.u. of available power, comma separated)',
+           default='1.0')
+info.param('vw.voltage_program', label='Voltage steps executed as a grid simulator program', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.der_verify', label='Verify EUT settings by reading them back', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.result_db', label='Result summary database file (empty to disable)', default='')
+info.param('vw.resume', label='Resume an interrupted test at the next uncompleted step', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.fail_fast', label='Abort the curve when a step has irrecoverably failed', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.dataset_timing', label='Resolve the step values at the DAQ timestamps of the dataset',
+           default='Disabled', values=['Disabled', 'Enabled'])
+info.param('vw.dataset_pyramid', label='Build the multi-resolution pyramid of the datasets', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.acquisition_rate', label='Background acquisition rate (Hz, 0 to sample on demand)', default=0.)
+info.param('vw.log_level', label='Library log level', default='Info', values=['Debug', 'Info', 'Error'])
+info.param('vw.log_records', label='Write the library log records (JSON lines)', default='Disabled',
+           values=['Disabled', 'Enabled'])
+info.param('vw.mc_samples', label='Monte Carlo samples per step for the flip probabilities (0 to disable)',
+           default=0)
+info.param('vw.mc_workers', label='Monte Carlo worker processes', default=1)
+info.param('vw.mc_distribution', label='Monte Carlo measurement error distribution', default='Normal',
+           values=['Normal', 'Uniform'])
 
 info.param('vw.test_AR_Vw1', label='Setting Vw1', default=250.,
            active='vw.test_AR', active_value=['Enabled'])
@@ -447,13 +672,12 @@ info.param('eut.f_nom', label='Nominal AC frequency (Hz)', default=50.0)
 info.param('eut.f_max', label='Maximum frequency in the continuous operating region (Hz)', default=55.)
 info.param('eut.f_min', label='Minimum frequency in the continuous operating region (Hz)', default=45.)
 
-'''
 info.param('eut.imbalance_resp', label='EUT response to phase imbalance is calculated by:',
            default='EUT response to the average of the three-phase effective (RMS)',
            values=['EUT response to the individual phase voltages',
                    'EUT response to the average of the three-phase effective (RMS)',
-                   'EUT response to the positive sequence of voltages'])
-'''
+                   'EUT response to the positive sequence of voltages'],
+           active='eut.phases', active_value=['Three phase'])
 
 
 # Other equipment parameters